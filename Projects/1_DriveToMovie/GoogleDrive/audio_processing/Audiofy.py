@@ -1,19 +1,63 @@
+import subprocess
 from os import path, mkdir
-from moviepy.editor import VideoFileClip, AudioFileClip
+from typing import List, Union
+from Playlist import playlist_args
 
-def audiofy(video_path: str, duration:int, audio_name: str = "audio.mp3", 
+def mux_command(video_path: str, audio_path: Union[str, List[str]], duration: int,
+    output_path: str, copy_video: bool = True) -> List[str]:
+
+    """
+    Builds the ffmpeg command which puts an audio track on a video.
+
+    Args:
+        video_path (str): The path to the video file.
+        audio_path (str or list): The path to the audio file, or the paths to
+                                  the tracks of a playlist (see Playlist.py).
+        duration (int): Duration (in seconds) the audio is cut at.
+        output_path (str): The path to the output video file.
+        copy_video (bool, optional): Copy the video stream as is instead of
+                                     re-encoding it with libx264. Defaults to True.
+
+    Returns:
+        list: The ffmpeg command line.
+    """
+
+    command = ["ffmpeg", "-y", "-nostats", "-loglevel", "error", "-i", video_path]
+
+    # only the audio is cut, the video is left as long as it is
+    if isinstance(audio_path, str):
+        command += ["-t", str(duration), "-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    else:
+        command += playlist_args(audio_path, 1, duration)
+        command += ["-map", "0:v", "-map", "[playlist]"]
+
+    return command + [
+        "-c:v", "copy" if copy_video else "libx264",
+        # the audio is the only stream encoded
+        "-c:a", "aac", "-b:a", "192k",
+        output_path,
+    ]
+
+
+def audiofy(video_path: str, duration:int,
+    audio_name: Union[str, List[str]] = "audio.mp3",
     output_name: str = "final.mp4") -> str:
-    
+
     """
     Adds an audio track to a video file and saves the output.
 
+    The video stream is copied as is and only the audio is encoded, so adding
+    music takes seconds whatever the length of the video. The video is only
+    re-encoded (libx264) if its stream can't be copied into the output.
+
     Args:
-        video_name (str): The name of the video file to which the 
+        video_name (str): The name of the video file to which the
                           audio will be added.
         duration (int) : Duration of the video, audio.
-        audio_name (str): The name of the audio file to be added to 
-                          the video.
-        output_name (str): The name of the output video file with the 
+        audio_name (str or list): The name of the audio file to be added to
+                                  the video, or the names of the tracks of a
+                                  playlist (crossfaded and loudness normalized).
+        output_name (str): The name of the output video file with the
                            added audio.
 
     Returns:
@@ -29,13 +73,16 @@ def audiofy(video_path: str, duration:int, audio_name: str = "audio.mp3",
     audio_path = "resources\\audios"
 
     try:
-        # Load video and audio clips
-        video_clip = VideoFileClip(video_path)
-        audio_clip = AudioFileClip(path.join(audio_path, audio_name))
-        cropped_audio = audio_clip.subclip(0, duration)
+        if isinstance(audio_name, str):
+            audio_file = path.join(audio_path, audio_name)
+            audio_files = [audio_file]
+        else:
+            audio_file = audio_files = [path.join(audio_path, name) for name in audio_name]
 
-        # Set the audio of the video clip
-        video_clip = video_clip.set_audio(cropped_audio)
+        # ffmpeg would only say it failed
+        for file in [video_path] + audio_files:
+            if not path.exists(file):
+                raise FileNotFoundError(file)
 
         # If the directory doesn't exist, create it
         if not path.exists(final_path):
@@ -44,13 +91,16 @@ def audiofy(video_path: str, duration:int, audio_name: str = "audio.mp3",
         # Define output file path
         output_path = path.join(final_path, output_name)
 
-        # Write the merged video with audio
-        video_clip.write_videofile(output_path, codec='libx264', audio_codec='mp3')
+        try:
+            # Copy the video stream, encode the audio
+            subprocess.run(mux_command(video_path, audio_file, duration, output_path),
+                check=True)
 
-        # Close the clips
-        video_clip.close()
-        cropped_audio.close()
-        audio_clip.close()
+        except subprocess.CalledProcessError as error:
+            # The video codec doesn't fit in the container
+            print(f"\n==== Couldn't copy the video stream ({error}), re-encoding it ====\n")
+            subprocess.run(mux_command(video_path, audio_file, duration, output_path,
+                copy_video=False), check=True)
 
         print("\n==== DONE adding audio to the video ====\n")
 
@@ -59,7 +109,7 @@ def audiofy(video_path: str, duration:int, audio_name: str = "audio.mp3",
     except FileNotFoundError as ferror:
         print(f"\n\n**** FILE NOT FOUND: {ferror} ****\n\n")
         return None
-    
+
     except Exception as error:
         print(f"\n\n**** ERROR IN audiofy: {error}\n\n")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,252 @@
+"""
+Beats of the audio, for the cuts of the slideshow to land on (--beat_sync).
+
+The images used to change at even intervals whatever the music did. The beats
+(onsets) of the audio are found with spectral flux: the audio is decoded by
+ffmpeg to mono PCM and read in blocks, every block is cut into overlapping
+windows whose spectra (np.fft.rfft) are compared with the previous window's,
+and the peaks of the rise in energy are the beats. Only one block of samples
+is in memory at a time, whatever the length of the track.
+
+The analysis of a track is cached by the hash of the audio file:
+
+    resources\\beat_cache\\<sha1 of the audio>_<parameters>.json   {"beats": [seconds, ...]}
+
+so rendering again with the same music costs a hash. A playlist is analysed
+as it's played, crossfades included (see Playlist.py), and cached under the
+hashes of all of its tracks. Timeline.beat_cuts then moves the cuts between
+the images onto the nearest beats.
+"""
+
+import json
+import subprocess
+import numpy as np
+from hashlib import sha1
+from os import path, makedirs, replace
+from typing import Iterator, List, Optional, Union
+from Playlist import playlist_args, CROSSFADE_SECONDS
+
+# Analysis parameters, part of the cache key
+SAMPLE_RATE = 22050
+WINDOW = 2048
+HOP = 512
+
+# Samples decoded at a time
+BLOCK_SAMPLES = SAMPLE_RATE * 10
+
+
+def audio_blocks(audio_path: Union[str, List[str]], sample_rate: int = SAMPLE_RATE,
+    block_samples: int = BLOCK_SAMPLES) -> Iterator[np.ndarray]:
+
+    """
+    Decodes an audio file to mono samples with ffmpeg, a block at a time.
+
+    Args:
+        audio_path (str or list): The path to the audio file, or the paths to
+                                  the tracks of a playlist.
+        sample_rate (int, optional): Sample rate of the decoded audio.
+                                     Defaults to SAMPLE_RATE.
+        block_samples (int, optional): Samples per block. Defaults to 10 s.
+
+    Yields:
+        np.ndarray: The next block of float32 samples (the last may be shorter).
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg failed.
+    """
+
+    command = ["ffmpeg", "-nostats", "-loglevel", "error"]
+
+    if isinstance(audio_path, str):
+        command += ["-i", audio_path]
+    else:
+        # Loudness doesn't move the beats
+        command += playlist_args(audio_path, 0, normalize=False) + ["-map", "[playlist]"]
+
+    # raw mono float samples to stdout
+    command += ["-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(block_samples * 4)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) // 4 * 4], dtype=np.float32)
+
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def spectral_flux(blocks: Iterator[np.ndarray], window: int = WINDOW,
+    hop: int = HOP) -> np.ndarray:
+
+    """
+    Computes the onset strength of the audio, window by window.
+
+    Args:
+        blocks (Iterator[np.ndarray]): The samples, in blocks (see audio_blocks).
+        window (int, optional): Samples per FFT window. Defaults to WINDOW.
+        hop (int, optional): Samples between two windows. Defaults to HOP.
+
+    Returns:
+        np.ndarray: The spectral flux of every window (window k starts at
+                    sample k * hop).
+    """
+
+    hann = np.hanning(window).astype(np.float32)
+    flux = []
+    previous = None
+
+    # Samples of the previous block the next windows still overlap
+    tail = np.zeros(0, dtype=np.float32)
+
+    for block in blocks:
+        samples = np.concatenate((tail, block))
+        count = (len(samples) - window) // hop + 1
+        if count <= 0:
+            tail = samples
+            continue
+
+        # Overlapping windows as a view, no copy
+        frames = np.lib.stride_tricks.sliding_window_view(samples, window)[::hop][:count]
+        spectra = np.log1p(np.abs(np.fft.rfft(frames * hann, axis=1)))
+
+        # Rise in energy from one window to the next, summed over the frequencies
+        if previous is None:
+            previous = spectra[0]
+        rise = np.diff(np.vstack((previous, spectra)), axis=0)
+        flux.append(np.maximum(rise, 0).sum(axis=1))
+
+        previous = spectra[-1]
+        tail = samples[count * hop:]
+
+    return np.concatenate(flux) if flux else np.zeros(0)
+
+
+def pick_beats(flux: np.ndarray, sample_rate: int = SAMPLE_RATE, window: int = WINDOW,
+    hop: int = HOP, min_gap: float = 0.2, delta: float = 0.5) -> List[float]:
+
+    """
+    Picks the beats out of the onset strength.
+
+    A window is a beat if its flux is the highest around it and stands out from
+    the local average by delta standard deviations. Beats closer than min_gap
+    to the previous one are dropped.
+
+    Args:
+        flux (np.ndarray): The spectral flux, as returned by spectral_flux.
+        sample_rate (int, optional): Sample rate of the audio. Defaults to SAMPLE_RATE.
+        window (int, optional): Samples per FFT window. Defaults to WINDOW.
+        hop (int, optional): Samples between two windows. Defaults to HOP.
+        min_gap (float, optional): Shortest time (in seconds) between two beats.
+                                   Defaults to 0.2.
+        delta (float, optional): Threshold above the local average, in standard
+                                 deviations of the flux. Defaults to 0.5.
+
+    Returns:
+        list: The times (in seconds) of the beats.
+    """
+
+    if len(flux) < 3:
+        return []
+
+    # Local average over about half a second
+    span = max(1, int(0.25 * sample_rate / hop))
+    average = np.convolve(flux, np.ones(2 * span + 1) / (2 * span + 1), mode="same")
+
+    # Highest within a tenth of a second either way
+    reach = max(1, int(0.05 * sample_rate / hop))
+    padded = np.pad(flux, reach, mode="constant", constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * reach + 1).max(axis=1)
+
+    peaks = np.flatnonzero((flux == local_max) & (flux > average + delta * flux.std()))
+
+    beats = []
+    for peak in peaks:
+        # At the centre of the window
+        time = (peak * hop + window / 2) / sample_rate
+        if not beats or time - beats[-1] >= min_gap:
+            beats.append(time)
+
+    return beats
+
+
+def audio_hash(audio_path: str) -> str:
+
+    """
+    Hashes the contents of an audio file.
+
+    Args:
+        audio_path (str): The path to the audio file.
+
+    Returns:
+        str: The SHA-1 of the file.
+    """
+
+    digest = sha1()
+    with open(audio_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def detect_beats(audio_path: Union[str, List[str]], duration: Optional[float] = None,
+    cache_dir: str = "resources\\beat_cache") -> List[float]:
+
+    """
+    Finds the beats of an audio file (or playlist), from the cache if it was
+    analysed before.
+
+    Args:
+        audio_path (str or list): The path to the audio file, or the paths to
+                                  the tracks of a playlist.
+        duration (float, optional): Only the beats before this many seconds are
+                                    returned. Defaults to None (all of them).
+        cache_dir (str, optional): Directory of the cached analyses.
+                                   Defaults to "resources\\beat_cache".
+
+    Returns:
+        list: The times (in seconds) of the beats.
+    """
+
+    # Same track, same parameters, same beats
+    if isinstance(audio_path, str):
+        name = audio_path
+        digest = audio_hash(audio_path)
+    else:
+        name = ", ".join(audio_path)
+        tracks = "".join(audio_hash(track) for track in audio_path)
+        digest = sha1(f"{tracks}_{CROSSFADE_SECONDS}".encode()).hexdigest()
+    key = f"{digest}_{SAMPLE_RATE}_{WINDOW}_{HOP}"
+    cache_path = path.join(cache_dir, f"{key}.json")
+
+    try:
+        with open(cache_path) as f:
+            beats = json.load(f)["beats"]
+        print(f"\n==== Found {len(beats)} beat(s) of {name} in the cache ====\n")
+
+    except (FileNotFoundError, ValueError, KeyError):
+        print(f"\n==== Finding the beats of {name} ====\n")
+        beats = pick_beats(spectral_flux(audio_blocks(audio_path)))
+
+        # If the directory doesn't exist, create it
+        if not path.exists(cache_dir):
+            makedirs(cache_dir)
+
+        # Write to a temporary file first so a crash never leaves half an analysis
+        with open(f"{cache_path}.tmp", "w") as f:
+            json.dump({"beats": beats}, f)
+        replace(f"{cache_path}.tmp", cache_path)
+
+        print(f"\n==== Found {len(beats)} beat(s), saved to {cache_path} ====\n")
+
+    if duration is not None:
+        beats = [time for time in beats if time < duration]
+
+    return beats
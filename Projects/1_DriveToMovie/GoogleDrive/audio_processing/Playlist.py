@@ -0,0 +1,89 @@
+"""
+Several audio tracks played one after the other (--playlist).
+
+A video used to have one song, audio.mp3, cut at the duration. Long videos can
+have a playlist instead: the tracks are crossfaded into each other, normalized
+to the same loudness (EBU R128, ffmpeg's loudnorm) and padded with silence or
+cut to the exact duration, all in one ffmpeg filter graph:
+
+    [1:a][2:a]acrossfade[x1];[x1][3:a]acrossfade[x2];
+    [x2]loudnorm,aresample,apad,atrim[playlist]
+
+The tracks are decoded, mixed and encoded in a single streaming pass, nothing
+is written to disk in between. Whoever runs ffmpeg (audiofy, FFmpegEncoder,
+BeatSync) adds playlist_args after its other inputs and maps "[playlist]".
+"""
+
+from typing import List, Optional
+
+# Seconds two tracks overlap for
+CROSSFADE_SECONDS = 3.0
+
+# EBU R128 target: integrated loudness, true peak, loudness range
+LOUDNESS = "I=-16:TP=-1.5:LRA=11"
+
+# loudnorm works at 192 kHz, brought back to this
+SAMPLE_RATE = 48000
+
+
+def playlist_filter(first_input: int, count: int, duration: Optional[float] = None,
+    crossfade: float = CROSSFADE_SECONDS, normalize: bool = True) -> str:
+
+    """
+    Builds the ffmpeg filter graph which plays the tracks one after the other.
+
+    Args:
+        first_input (int): The ffmpeg input index of the first track, the others
+                           follow it.
+        count (int): Number of tracks.
+        duration (float, optional): Pads or cuts the playlist to this many
+                                    seconds. Defaults to None (as long as it is).
+        crossfade (float, optional): Seconds two tracks overlap for.
+                                     Defaults to CROSSFADE_SECONDS.
+        normalize (bool, optional): Normalize the loudness. Defaults to True.
+
+    Returns:
+        str: The filter graph, whose output is labelled "[playlist]".
+    """
+
+    graph = []
+    last = f"[{first_input}:a]"
+
+    # Every track fades into the next one
+    for index in range(1, count):
+        graph.append(f"{last}[{first_input + index}:a]acrossfade=d={crossfade}[x{index}]")
+        last = f"[x{index}]"
+
+    chain = []
+    if normalize:
+        chain += [f"loudnorm={LOUDNESS}", f"aresample={SAMPLE_RATE}"]
+    if duration is not None:
+        # Silence after the last track, then cut at the duration
+        chain += ["apad", f"atrim=end={duration}"]
+
+    graph.append(f"{last}{','.join(chain) or 'anull'}[playlist]")
+
+    return ";".join(graph)
+
+
+def playlist_args(tracks: List[str], first_input: int, duration: Optional[float] = None,
+    crossfade: float = CROSSFADE_SECONDS, normalize: bool = True) -> List[str]:
+
+    """
+    Builds the ffmpeg arguments of a playlist: its inputs and its filter graph.
+
+    Args:
+        tracks (list): The paths to the audio files, in the order they're played.
+        first_input (int): Number of ffmpeg inputs before the tracks.
+        duration, crossfade, normalize: See playlist_filter.
+
+    Returns:
+        list: The ffmpeg arguments, to be followed by "-map [playlist]".
+    """
+
+    args = []
+    for track in tracks:
+        args += ["-i", track]
+
+    return args + ["-filter_complex", playlist_filter(first_input, len(tracks),
+        duration, crossfade, normalize)]
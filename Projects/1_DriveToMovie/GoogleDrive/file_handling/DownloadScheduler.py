@@ -0,0 +1,218 @@
+"""
+Scheduler for the Drive downloads.
+
+manage_files used to start one thread per 500 files, so a folder of a few
+hundred photos was downloaded one file at a time. The scheduler runs the
+downloads on a pool of threads, but only lets `workers` of them download at
+once, and moves that number while downloading:
+
+    - every `window` finished downloads it measures the throughput (files/sec),
+      and lets one more download in while the throughput keeps climbing
+    - when Drive answers with a rate limit (403 rateLimitExceeded /
+      userRateLimitExceeded or 429) it halves the number of downloads
+
+Downloads which failed because of a rate limit, a server error or a dropped
+connection are retried with exponential backoff and full jitter (local errors,
+a full disk or a missing folder, fail right away), so the threads
+which hit the limit together don't all come back at the same moment. Since
+download_file resumes from its .part file, a retry only fetches what's missing.
+"""
+
+import ssl
+import random
+import socket
+from http.client import IncompleteRead
+from httplib2 import ServerNotFoundError
+from time import monotonic, sleep
+from threading import Condition
+from concurrent.futures import ThreadPoolExecutor, Future
+from googleapiclient.errors import HttpError
+from typing import Callable, Any
+
+# Reasons Drive gives along with a 403 when it's a rate limit
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+# Status codes worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Network errors worth retrying: dropped or refused connections, timeouts, 
+# name lookups and TLS streams cut short
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, socket.gaierror, ssl.SSLEOFError,
+    IncompleteRead, ServerNotFoundError)
+
+
+def is_rate_limited(error: HttpError) -> bool:
+
+    """
+    Checks whether an error is Drive telling us to slow down.
+
+    Args:
+        error (HttpError): The error raised by the Google API client.
+
+    Returns:
+        bool: True if the error is a rate limit, False otherwise.
+    """
+
+    status = error.resp.status
+    content = error.content.decode(errors="ignore") if error.content else ""
+
+    return status == 429 or (status == 403 and
+        any(reason in content for reason in RATE_LIMIT_REASONS))
+
+
+class DownloadScheduler:
+
+    """
+    Runs downloads concurrently, adapting the number of concurrent downloads.
+
+    Attributes:
+    - workers (int): Number of downloads allowed at once right now.
+    - min_workers (int): The fewest downloads allowed at once.
+    - max_workers (int): The most downloads allowed at once.
+    - retries (int): Number of retries of a rate limited or failed download.
+    - base_delay (float): Delay before the first retry, in seconds.
+    - max_delay (float): Longest delay between retries, in seconds.
+    - window (int): Number of finished downloads between throughput checks.
+    """
+
+    def __init__(self, workers: int = 8, max_workers: int = 32,
+        min_workers: int = 1, retries: int = 6, base_delay: float = 1.0,
+        max_delay: float = 64.0, window: int = 20) -> None:
+
+        """
+        Initializes DownloadScheduler and its pool of threads.
+        """
+
+        self.workers = max(min_workers, min(workers, max_workers))
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = window
+
+        # Downloads running right now, guarded by the condition
+        self.active = 0
+        self.condition = Condition()
+
+        # Throughput bookkeeping
+        self.finished = 0
+        self.window_start = monotonic()
+        self.best_rate = 0.0
+
+        # One thread per download we may ever allow
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self) -> "DownloadScheduler":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.executor.shutdown(wait=True)
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> Future:
+
+        """
+        Schedules a download.
+
+        Args:
+            func (callable): The download function.
+            *args: Arguments of the download function.
+
+        Returns:
+            Future: The future of the download.
+        """
+        return self.executor.submit(self.run, func, *args)
+
+    def run(self, func: Callable[..., Any], *args: Any) -> Any:
+
+        """
+        Runs a download once there's room for it, retrying when needed.
+
+        Args:
+            func (callable): The download function.
+            *args: Arguments of the download function.
+
+        Returns:
+            The result of the download function.
+        """
+
+        for attempt in range(self.retries + 1):
+
+            # Wait for room
+            with self.condition:
+                while self.active >= self.workers:
+                    self.condition.wait()
+                self.active += 1
+
+            try:
+                result = func(*args)
+
+            except (HttpError,) + TRANSIENT_ERRORS as error:
+                if isinstance(error, HttpError):
+                    rate_limited = is_rate_limited(error)
+                    retryable = rate_limited or error.resp.status in RETRY_STATUSES
+                else:
+                    rate_limited, retryable = False, True
+
+                if not retryable or attempt == self.retries:
+                    raise
+
+                if rate_limited:
+                    self.slow_down()
+
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                print(f"\n**** Download failed ({error}), retrying in {delay:.1f}s. ****\n")
+
+            else:
+                self.record_finished()
+                return result
+
+            finally:
+                with self.condition:
+                    self.active -= 1
+                    self.condition.notify_all()
+
+            # Back off without holding a slot
+            sleep(delay)
+
+    def slow_down(self) -> None:
+
+        """
+        Halves the number of concurrent downloads after a rate limit.
+        """
+
+        with self.condition:
+            workers = max(self.min_workers, self.workers // 2)
+            if workers < self.workers:
+                print(f"\n==== Rate limited, down to {workers} concurrent downloads. ====\n")
+            self.workers = workers
+
+            # Measure again from here
+            self.best_rate = 0.0
+            self.finished = 0
+            self.window_start = monotonic()
+
+    def record_finished(self) -> None:
+
+        """
+        Counts a finished download and adds a concurrent download while the
+        throughput keeps climbing.
+        """
+
+        with self.condition:
+            self.finished += 1
+            if self.finished < self.window:
+                return
+
+            rate = self.finished / max(monotonic() - self.window_start, 1e-6)
+
+            # Still climbing, try one more
+            if rate > self.best_rate * 1.05 and self.workers < self.max_workers:
+                self.workers += 1
+                print(f"\n==== {rate:.1f} files/s, up to {self.workers} concurrent downloads. ====\n")
+                self.condition.notify_all()
+
+            self.best_rate = max(self.best_rate, rate)
+            self.finished = 0
+            self.window_start = monotonic()
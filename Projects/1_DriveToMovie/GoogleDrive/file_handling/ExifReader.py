@@ -0,0 +1,198 @@
+"""
+Capture time of the images from their EXIF metadata.
+
+File names and Drive's createdTime are only guesses of when a photo was taken,
+the camera writes the real one in the EXIF metadata (DateTimeOriginal). Two
+sources are used, neither of which downloads or decodes the whole image:
+
+    1. Drive's own 'imageMediaMetadata.time', which it extracts from the EXIF
+       of most JPEGs. It comes along with the listing, so it costs nothing.
+    2. For the files Drive has no time for (HEIC mostly), the first few KB of
+       the file are fetched with a range request and the EXIF block in them is
+       parsed. Both JPEG (APP1 segment) and HEIF (Exif item) carry the EXIF as
+       a TIFF structure right after "Exif\\0\\0", which is what's looked for.
+       HEIF headers also name the item type "Exif" (followed by a NUL) in their
+       item list before the payload, so only a match followed by a TIFF header
+       counts.
+
+The capture time is stored in the file metadata as 'imageMediaMetadata.time'
+("YYYY:MM:DD HH:MM:SS", the EXIF format), whichever source it came from, so
+get_actual_createdTime only has to look in one place.
+"""
+
+import struct
+from typing import List, Dict, Optional
+from google.auth.credentials import Credentials
+from googleapiclient.discovery import Resource
+from googleapiclient.errors import HttpError
+from GoogleDriveClient import ServicePool
+from DownloadScheduler import DownloadScheduler
+from FilesCreatedTime import capture_time
+
+# Bytes of the file fetched to look for the EXIF block
+HEADER_BYTES = 64 * 1024
+
+# Start of the TIFF structure, little and big endian
+TIFF_HEADERS = {b"II*\x00": "<", b"MM\x00*": ">"}
+
+# TIFF tags
+EXIF_IFD_POINTER = 0x8769
+DATETIME = 0x0132
+DATETIME_ORIGINAL = 0x9003
+
+def exif_datetime(data: bytes) -> Optional[str]:
+
+    """
+    Finds the capture time in the EXIF block of the first bytes of an image.
+
+    Args:
+        data (bytes): The first bytes of the image file.
+
+    Returns:
+        str: DateTimeOriginal (or DateTime if missing) as "YYYY:MM:DD HH:MM:SS",
+             None if no EXIF block or date is found.
+    """
+
+    # The TIFF structure follows "Exif\0\0" in both JPEG and HEIF, the first 
+    # match of a HEIF header is the name of the item type though
+    start = data.find(b"Exif\x00\x00")
+    while start >= 0 and data[start + 6:start + 10] not in TIFF_HEADERS:
+        start = data.find(b"Exif\x00\x00", start + 1)
+
+    if start < 0:
+        return None
+
+    tiff = data[start + 6:]
+
+    # Byte order of the TIFF structure
+    order = TIFF_HEADERS[tiff[:4]]
+
+    def read_ifd(offset: int) -> Dict[int, tuple]:
+
+        # Reads the entries (tag -> (type, count, value/offset)) of an IFD
+        entries = {}
+        if offset + 2 > len(tiff):
+            return entries
+
+        count = struct.unpack_from(f"{order}H", tiff, offset)[0]
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            if entry + 12 > len(tiff):
+                break
+            tag, kind, length, value = struct.unpack_from(f"{order}HHII", tiff, entry)
+            entries[tag] = (kind, length, value)
+
+        return entries
+
+    def read_ascii(entry: tuple) -> Optional[str]:
+
+        # Dates are 20 bytes of ASCII, always stored at an offset
+        kind, length, offset = entry
+        if kind != 2 or offset + length > len(tiff):
+            return None
+        return tiff[offset:offset + length].rstrip(b"\x00 ").decode("ascii", "ignore")
+
+    try:
+        ifd0 = read_ifd(struct.unpack_from(f"{order}I", tiff, 4)[0])
+
+        # DateTimeOriginal lives in the EXIF sub-IFD
+        if EXIF_IFD_POINTER in ifd0:
+            exif_ifd = read_ifd(ifd0[EXIF_IFD_POINTER][2])
+            if DATETIME_ORIGINAL in exif_ifd:
+                return read_ascii(exif_ifd[DATETIME_ORIGINAL])
+
+        # Otherwise the last modification date of the camera
+        if DATETIME in ifd0:
+            return read_ascii(ifd0[DATETIME])
+
+    except struct.error:
+        return None
+
+    return None
+
+
+def read_header(service: Resource, fid: str, header_bytes: int = HEADER_BYTES) -> bytes:
+
+    """
+    Fetches the first bytes of a file from Google Drive.
+
+    Args:
+        service (googleapiclient.discovery.Resource): The Google Drive API
+                                                       service instance.
+        fid (str): The ID of the file.
+        header_bytes (int, optional): Number of bytes to fetch. Defaults to 64 KB.
+
+    Returns:
+        bytes: The first bytes of the file.
+    """
+
+    request = service.files().get_media(fileId=fid)
+    headers = dict(request.headers, range=f"bytes=0-{header_bytes - 1}")
+    resp, content = request.http.request(request.uri, method="GET", headers=headers)
+
+    if resp.status not in (200, 206):
+        raise HttpError(resp, content, uri=request.uri)
+
+    return content[:header_bytes]
+
+
+def pooled_capture_time(services: ServicePool, file: Dict,
+    header_bytes: int = HEADER_BYTES) -> None:
+
+    """
+    Reads the capture time of a file from the EXIF block of its first bytes and
+    stores it in the metadata of the file.
+
+    Args:
+        services (ServicePool): The Google Drive API services of the threads.
+        file (dict): The metadata of the file, updated in place.
+        header_bytes (int, optional): Number of bytes to fetch. Defaults to 64 KB.
+
+    Returns:
+        None
+    """
+
+    time = exif_datetime(read_header(services.get(), file["id"], header_bytes))
+    if time:
+        file.setdefault("imageMediaMetadata", {})["time"] = time
+
+
+def fetch_capture_times(files: List[Dict], creds: Credentials, workers: int = 8,
+    header_bytes: int = HEADER_BYTES) -> List[Dict]:
+
+    """
+    Fills in the capture time of the files Drive has no capture time for, by
+    reading the EXIF block of their first bytes.
+
+    Args:
+        files (list): Metadata of the files, listed with EXIF_FIELDS.
+        creds (google.auth.credentials.Credentials): The Google Drive API credentials.
+        workers (int, optional): Number of concurrent header reads. Defaults to 8.
+        header_bytes (int, optional): Number of bytes fetched per file.
+                                      Defaults to 64 KB.
+
+    Returns:
+        list: The same files, with 'imageMediaMetadata.time' filled in where found.
+    """
+
+    # Files Drive couldn't tell the capture time of
+    missing = [file for file in files if capture_time(file) is None]
+
+    print(f"\n==== Reading the EXIF of {len(missing)} file(s) "
+          f"({len(files) - len(missing)} known from Drive) ====\n")
+
+    services = ServicePool(creds)
+
+    with DownloadScheduler(workers, workers) as scheduler:
+        futures = [(file, scheduler.submit(pooled_capture_time, services, file,
+            header_bytes)) for file in missing]
+
+        for file, future in futures:
+            # A missing capture time isn't worth stopping the workflow for
+            if future.exception() is not None:
+                print(f"\n\n**** ERROR READING EXIF OF '{file['name']}': {future.exception()} ****\n\n")
+
+    print(f"\n==== Capture time known for "
+          f"{sum(capture_time(file) is not None for file in files)} of {len(files)} file(s) ====\n")
+
+    return files
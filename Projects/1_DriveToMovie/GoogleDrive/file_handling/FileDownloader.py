@@ -1,38 +1,28 @@
+import re
 import sys
-from os import path, mkdir, makedirs
-from io import BytesIO
-from googleapiclient.discovery import build
+from os import path, mkdir, makedirs, utime, remove, replace
+from datetime import datetime, timezone
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
 from google.auth.credentials import Credentials
 from googleapiclient.discovery import Resource
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 sys.path.append(path.abspath("..\\google_drive"))
-from GoogleDriveClient import GoogleDriveClient
-from FilesCreatedTime import get_actual_createdTime
-from typing import List, Generator, Dict
+from GoogleDriveClient import GoogleDriveClient, ServicePool, FILE_FIELDS
+from FilesCreatedTime import get_actual_createdTime, resolve_created_times
+from DownloadScheduler import DownloadScheduler
+from Manifest import load_manifest, save_manifest, is_changed, apply_changes
+from OrderIndex import save_order, capture_order
+from typing import List, Dict, Optional, Tuple, Iterable
 from sys import exit
 
-
-def chunk_list(files: List[Dict], 
-    chunk_size: int) -> Generator[List[Dict], None, None]:
-    
-    """
-    Splits a list (of dicts) into chunks of a specified size.
-
-    Args:
-        files (list): The list (of dicts) to split.
-        chunk_size (int): The size of each chunk.
-
-    Returns:
-        generator: A generator yielding lists of chunks.
-    """
-    for i in range(0, len(files), chunk_size):
-        yield files[i:i + chunk_size]
+# Bytes requested at once while downloading
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
 
 
-def manage_files(folder_name: str, files: List[Dict], creds: Credentials, 
-    chunk_size: int = 500) -> str:
+def manage_files(folder_name: str, files: Iterable[Dict], creds: Credentials, 
+    workers: int = 8, max_workers: int = 32, sync: bool = False, 
+    start_page_token: Optional[str] = None, 
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
     
     """
     Manages the download and local storage of files from Google Drive.
@@ -44,15 +34,32 @@ def manage_files(folder_name: str, files: List[Dict], creds: Credentials,
 
     Args:
         folder_name (str): The name of the folder where files will be downloaded.
-        files (list): A list of dictionaries, where each dictionary contains 
-                      information about a file to be downloaded, including its 
-                      'id' and 'mimeType'.
+        files (iterable): A list (or generator) of dictionaries, where each 
+                          dictionary contains information about a file to be 
+                          downloaded, including its 'id' and 'mimeType'. Files 
+                          from a generator are downloaded as they come.
         creds (google.auth.credentials.Credentials): The Google Drive API credentials.
-        chunk_size (int): The number of files per chunk to be processed by each 
-                          service instance.
+        workers (int, optional): Number of concurrent downloads to start with. 
+                                 Defaults to 8.
+        max_workers (int, optional): Most concurrent downloads the scheduler may 
+                                     ramp up to. Defaults to 32.
+        sync (bool, optional): Only download the files which are new or changed 
+                               since the last run, according to the manifest of 
+                               the folder, and remove the ones which are gone 
+                               from Drive. Defaults to False.
+        start_page_token (str, optional): Token of Drive's changes feed saved in 
+                                          the manifest for the next run (sync only), 
+                                          once every download succeeded.
+        chunk_size (int, optional): Number of bytes requested at once while 
+                                    downloading a file. Defaults to 8 MB.
 
     Returns:
         str: The path to the folder where files have been downloaded.
+
+    Note:
+        Also saves the ordering index of the folder (see OrderIndex), the files 
+        ordered by capture time, which image_modifier reads instead of parsing 
+        the dates back out of the filenames.
     """
     print("\n==== Downloading images ====\n")
     # Create the download folder if it doesn't exist
@@ -60,50 +67,228 @@ def manage_files(folder_name: str, files: List[Dict], creds: Credentials,
     downloading_path = path.join(rsrc_path, folder_name)
     if not path.exists(downloading_path):
         makedirs(downloading_path)
+
+    # Total files in the folder, whether downloaded now or not
+    total_files = 0
+
+    if sync:
+        # Syncing needs the whole listing to tell which files are gone
+        files = list(files)
+        total_files = len(files)
+        manifest = load_manifest(folder_name)
+        files = sync_local_files(manifest, files, downloading_path)
     
-    # Split the list of files into chunks
-    file_chunks = list(chunk_list(files, chunk_size))
+    # Resolve the creation times of a complete listing before any download 
+    # starts, files from a generator are resolved as they come
+    fnames = resolve_created_times(files) if isinstance(files, list) else None
+
+    # Google Drive Services shared by the download threads
+    services = ServicePool(creds)
+
+    # Whether every file was downloaded
+    complete = False
 
     try:
-        # Create a ThreadPoolExecutor to download files concurrently
-        with ThreadPoolExecutor(max_workers=len(file_chunks)) as executor:
-            futures = []
-            for file_chunk in file_chunks:
-                for file in file_chunk:
-                    # Building Google Drive Service
-                    service = build("drive", "v3", credentials=creds)
-                    
-                    # Extract file information
-                    fid = file["id"]
-                    fname = get_actual_createdTime(file)
-                    fext = file["mimeType"].split("/")[1]
-
-                    # submitting task, appending it's result
-                    futures.append(executor.submit(download_file, service, fid, 
-                        fname, fext, downloading_path))
-
-            # Wait for all futures to complete
-            for future in futures:
-                future.result()
+        # Create a DownloadScheduler to download files concurrently
+        with DownloadScheduler(workers, max_workers) as scheduler:
+            futures = {}
+            for index, file in enumerate(files):
+                # Extract file information
+                fid = file["id"]
+                fname = fnames[index] if fnames is not None else get_actual_createdTime(file)
+                fext = file["mimeType"].split("/")[1]
+
+                # submitting task, appending it's result
+                futures[scheduler.submit(pooled_download, services, fid, fname, fext, 
+                    downloading_path, file["modifiedTime"], chunk_size)] = (file, fname)
+
+                if not sync:
+                    total_files += 1
+
+            # (capture time, file id, local name) of the downloaded files
+            downloaded = []
+            errors = []
+
+            # Wait for all futures to complete, a failed download doesn't stop 
+            # the others from being recorded
+            for future in as_completed(futures):
+                file, fname = futures[future]
+                try:
+                    file_path = future.result()
+                except Exception as error:
+                    errors.append(error)
+                    continue
+
+                downloaded.append((fname, file["id"], path.basename(file_path)))
+
+                # Remember what was downloaded and under which name
+                if sync:
+                    manifest["files"][file["id"]] = {**file, 
+                        "local_name": path.basename(file_path)}
+
+            if errors:
+                print(f"\n\n**** {len(errors)} DOWNLOAD(S) FAILED ****\n\n")
+                raise errors[0]
+
+            complete = True
+
+        # A sync run only downloaded the changes, the rest is in the manifest
+        if sync:
+            entries = list(manifest["files"].values())
+            downloaded = [(fname, entry["id"], entry["local_name"]) 
+                for fname, entry in zip(resolve_created_times(entries), entries)]
+
+        # Hand the order of the video over to image_modifier
+        save_order(downloading_path, capture_order(downloaded))
 
     except Exception as error:
         print(f"\n\n**** AN UNEXPECTED ERROR OCCURRED: {error} ****\n\n")
         raise
 
+    finally:
+        # Keep whatever was downloaded, even if a download failed. The token 
+        # only moves on once every change is downloaded, otherwise the next run 
+        # asks for the same changes again and picks up the failed files
+        if sync:
+            if complete:
+                manifest["start_page_token"] = start_page_token
+            save_manifest(folder_name, manifest)
+
     # Final message before function terminates
-    print(f"\nTotal of {len(files)} files saved to {downloading_path}")
+    print(f"\nTotal of {total_files} files saved to {downloading_path}")
 
     print("\n==== DONE downloading images ====\n")
     # Return the download folder path
     return downloading_path
 
 
+def sync_local_files(manifest: Dict, files: List[Dict], 
+    downloading_path: str) -> List[Dict]:
+    
+    """
+    Brings the download folder in line with the files on Drive.
+
+    Removes the local copies of the files which are gone from Drive or changed 
+    since they were downloaded, and works out which files have to be downloaded.
+
+    Args:
+        manifest (dict): The manifest of the folder, updated in place.
+        files (list): The metadata of the files currently in the Drive folder.
+        downloading_path (str): The folder where files are downloaded.
+
+    Returns:
+        list: The files which are new or changed and have to be downloaded.
+    """
+
+    entries = manifest["files"]
+    current_ids = {file["id"] for file in files}
+    to_download = []
+
+    def remove_local(fid: str) -> None:
+
+        # Removes the local copy of a file and forgets about it
+        local_path = path.join(downloading_path, entries.pop(fid)["local_name"])
+        if path.exists(local_path):
+            remove(local_path)
+
+    # Files which are gone from Drive
+    for fid in [fid for fid in entries if fid not in current_ids]:
+        print(f"File - {fid} is gone from Drive, removing it.")
+        remove_local(fid)
+
+    # Files which are new, changed or missing locally
+    for file in files:
+        entry = entries.get(file["id"])
+        if (is_changed(file, entry) or 
+            not path.exists(path.join(downloading_path, entry["local_name"]))):
+            if entry is not None:
+                remove_local(file["id"])
+            to_download.append(file)
+
+    print(f"\n==== {len(files) - len(to_download)} file(s) up to date, "
+          f"{len(to_download)} to download. ====\n")
+
+    return to_download
+
+
+def sync_listing(googledriveclient: GoogleDriveClient, folder_ids: List[str], 
+    extensions: List[str], folder_name: str, recursive: bool = False, 
+    list_workers: int = 4, fields: str = FILE_FIELDS) -> Tuple[List[Dict], Optional[str]]:
+    
+    """
+    Lists the files of the Drive folder for a sync run.
+
+    The first run lists the whole folder. Later runs only ask Drive for the 
+    changes since the previous run and apply them to the manifest.
+
+    Args:
+        googledriveclient (GoogleDriveClient): The Google Drive client.
+        folder_ids (list): List of folder IDs in Google Drive.
+        extensions (list): List of MIME types of the desired files.
+        folder_name (str): The name of the Drive folder.
+        recursive (bool, optional): Also look in the subfolders. Defaults to False.
+        list_workers (int, optional): Number of folders listed at once when 
+                                      looking recursively. Defaults to 4.
+        fields (str, optional): Metadata fields retrieved for every file. 
+                                Defaults to FILE_FIELDS.
+
+    Returns:
+        tuple: The metadata of the files in the folder and the start page token 
+               to pass on to manage_files.
+
+    Note:
+        Recursive runs always walk the whole tree (and save no token), since 
+        the changes of the drive don't tell which subfolders are in the tree.
+    """
+
+    manifest = load_manifest(folder_name)
+
+    if recursive:
+        files = list(googledriveclient.walk_folder_tree(folder_ids, extensions, 
+            fields, workers=list_workers))
+        start_page_token = None
+    elif manifest["start_page_token"] is None:
+        # Take the token before listing, so changes made meanwhile aren't missed
+        start_page_token = googledriveclient.get_start_page_token()
+        files = googledriveclient.get_files_from_folder(folder_ids, extensions, fields)
+    else:
+        changes, start_page_token = googledriveclient.get_changes(
+            manifest["start_page_token"], fields)
+        files = apply_changes(manifest, changes, folder_ids, extensions)
+
+    return files, start_page_token
+
+
+def pooled_download(services: ServicePool, fid: str, fname: str, fext: str, 
+    downloading_path: str, modified_time: Optional[str] = None, 
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    
+    """
+    Downloads a file from Google Drive with the service of the calling thread.
+
+    Args:
+        services (ServicePool): The Google Drive API services of the threads.
+        fid, fname, fext, downloading_path, modified_time, chunk_size: Same as 
+        download_file.
+
+    Returns:
+        str: The path of the saved file.
+    """
+    return download_file(services.get(), fid, fname, fext, downloading_path, 
+        modified_time, chunk_size)
+
+
 def download_file(service: Resource, fid: str, fname: str, fext: str, 
-    downloading_path: str) -> None:
+    downloading_path: str, modified_time: Optional[str] = None, 
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
     
     """
     Downloads a file from Google Drive.
 
+    The file is streamed chunk by chunk into a .part file next to its final 
+    path, which is renamed once the download is complete. If a .part file is 
+    left over from an interrupted download, the download resumes from its size.
+
     Args:
         service (googleapiclient.discovery.Resource): The Google Drive API 
                                                        service instance.
@@ -111,33 +296,79 @@ def download_file(service: Resource, fid: str, fname: str, fext: str,
         fname (str): The name of the file.
         fext (str): The extension of the file.
         downloading_path (str): The folder to save the downloaded file.
+        modified_time (str, optional): Drive's 'modifiedTime' of the file, set 
+                                       as the mtime of the saved file so later 
+                                       stages (the frame cache) can tell when 
+                                       the file changed on Drive.
+        chunk_size (int, optional): Number of bytes requested at once. 
+                                    Defaults to 8 MB.
 
     Returns:
-        None
+        str: The path of the saved file.
     """
     
     # Print the file being downloaded
     print(f"File - {fid}_{fname}.{fext} is being downloaded.")
 
+    # Adjust extension for HEIF files
+    if fext == "heif":
+        fext = "heic"
+    
+    # Generate the unique file path
+    file_path = path.join(downloading_path, f"{fid}_{fname}.{fext}")
+
+    # The .part file carries the version of the file, so a leftover of an older 
+    # version is never resumed
+    version = re.sub(r"\D", "", modified_time) if modified_time else "0"
+    part_path = f"{file_path}.{version}.part"
+
     # Download the file
     try:
         request = service.files().get_media(fileId=fid)
-        fh = BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-
-        # Download file in chunks
-        while not done:
-            status, done = downloader.next_chunk()
-
-        # Adjust extension for HEIF files
-        if fext == "heif":
-            fext = "heic"
-        
-        # Generate the unique file path
-        file_path = path.join(downloading_path, f"{fid}_{fname}.{fext}")
-        with open(file_path, 'wb') as f:
-            f.write(fh.getvalue())
+        headers = dict(request.headers)
+
+        # Resume from whatever an interrupted download left
+        offset = path.getsize(part_path) if path.exists(part_path) else 0
+        if offset:
+            print(f"File - {fid}_{fname}.{fext} resuming from byte {offset}.")
+
+        with open(part_path, 'ab') as f:
+
+            # Download file in chunks
+            while True:
+                headers["range"] = f"bytes={offset}-{offset + chunk_size - 1}"
+                resp, content = request.http.request(request.uri, method="GET", 
+                    headers=headers)
+
+                # Nothing left past the offset, the file is complete
+                if resp.status == 416:
+                    break
+
+                if resp.status not in (200, 206):
+                    raise HttpError(resp, content, uri=request.uri)
+
+                # The whole file came back, the range was ignored
+                if resp.status == 200:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(content)
+                    break
+
+                f.write(content)
+                offset += len(content)
+
+                # "bytes start-end/total"
+                if offset >= int(resp["content-range"].rsplit("/", 1)[1]):
+                    break
+
+        # The file is complete, put it in its place
+        replace(part_path, file_path)
+
+        # Carry Drive's modifiedTime over to the saved file
+        if modified_time is not None:
+            mtime = datetime.strptime(modified_time, "%Y-%m-%dT%H:%M:%S.%fZ").replace(
+                tzinfo=timezone.utc).timestamp()
+            utime(file_path, (mtime, mtime))
 
     except HttpError as error:
         print(f"\n\n**** AN ERROR HAS OCCURRED: {error} ****\n\n")
@@ -149,3 +380,5 @@ def download_file(service: Resource, fid: str, fname: str, fext: str,
 
     # Print success message
     print(f"File {fid}_{fname}.{fext} has been saved.")
+
+    return file_path
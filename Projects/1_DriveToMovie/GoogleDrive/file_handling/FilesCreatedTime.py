@@ -10,6 +10,9 @@ on that metadata alone isn't going to work.
 So we are going to extract dates from the file names itself and then compare it with
 'createdTime' metadata and choose the earliest date&time among those two.
 
+When the capture time of the image is known from its EXIF (see ExifReader, --exif),
+that one is used instead, since it's what the camera itself recorded.
+
 # Known patterns to dissect
 
     1. 2016-05-07-23-26-37-161_1462861145654.jpg
@@ -23,21 +26,63 @@ So we are going to extract dates from the file names itself and then compare it
        IMG_20160218_212803.jpg *
     7. collage_20141221154525979_20141221154619994.jpg
        collage_20141221154525979.jpg
+    8. WhatsApp Image 2020-05-06 at 10.11.12.jpeg *
 
 These might not cover all of the patterns but, these were extracted manually by going 
 through images as a starting point.
 
-At first, we will use general methods like dateutil.parser which can help
-extract dates from most common formats. And then we will use regex to
-extract dates from other filenames.
+At first, we used general methods like dateutil.parser which can help
+extract dates from most common formats, and then regex to extract dates from
+other filenames. dateutil's fuzzy parsing turned out to be very slow, so now a
+single precompiled regex covering all of the patterns above is tried first and
+dateutil is only the last resort (it still fills in the time where the regex
+only finds a date). Results are memoized by file name.
+
+Run this file to benchmark the date extraction over the patterns above and
+check the dates extracted from them.
 
 * - handled by dateutil.parser
 """
 
 import re
+from time import perf_counter
 from datetime import datetime
+from functools import lru_cache
 from dateutil import parser
-from typing import Optional
+from typing import Optional, List, Dict
+
+# My files aren't older than 2014, dates before that are parsing mistakes
+CUTOFF = datetime(2014, 1, 1)
+
+# Format of the EXIF dates, as in Drive's 'imageMediaMetadata.time'
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+# Single pattern covering the known patterns above, the date separator ("", "-"
+# or "_") has to be the same throughout the date and so does the time separator
+DATE_PATTERN = re.compile(
+    r"(?<!\d)(?P<year>20\d{2})(?P<sep>[-_]?)(?P<month>\d{2})(?P=sep)(?P<day>\d{2})"
+    r"(?:[-_ T]?(?P<hour>\d{2})(?P<tsep>[-_]?)(?P<minute>\d{2})(?P=tsep)(?P<second>\d{2}))?"
+)
+
+# The known patterns and the dates extracted from them, used to benchmark and 
+# check the date extraction
+KNOWN_DATES = {
+    "2016-05-07-23-26-37-161_1462861145654": datetime(2016, 5, 7, 23, 26, 37),
+    "20140702_193810": datetime(2014, 7, 2, 19, 38, 10),
+    "20150105_205630 (1)": datetime(2015, 1, 5, 20, 56, 30),
+    "20150125_025739_20150126143255133": datetime(2015, 1, 25, 2, 57, 39),
+    "B612_20151228_132423": datetime(2015, 12, 28, 13, 24, 23),
+    "Screenshot_2023-04-05-17-48-02-94_40deb401b9ffe8e1df2f1cc5ba480b12": 
+        datetime(2023, 4, 5, 17, 48, 2),
+    "Screenshot_2021-03-21-01-27-51-81": datetime(2021, 3, 21, 1, 27, 51),
+    "IMG-20200601-WA0030": datetime(2020, 6, 1, 0, 30),
+    "IMG_20160218_212803": datetime(2016, 2, 18, 21, 28, 3),
+    # "WhatsApp Image 2020-05-06 at 10.11.12.jpeg", cut at the first "."
+    "WhatsApp Image 2020-05-06 at 10": datetime(2020, 5, 6, 10),
+    "collage_20141221154525979_20141221154619994": datetime(2014, 12, 21, 15, 45, 25),
+    "collage_20141221154525979": datetime(2014, 12, 21, 15, 45, 25),
+}
+KNOWN_FILENAMES = list(KNOWN_DATES)
 
 def get_actual_createdTime(file:str) -> str:
     """
@@ -50,94 +95,186 @@ def get_actual_createdTime(file:str) -> str:
     Returns:
     - datetime: The determined creation time of the file.
 
-    This function attempts to parse the creation time from the file name 
-    using date parsing utilities. If parsing fails, it falls back to the 
+    If the EXIF capture time of the image is known (see capture_time), it's 
+    returned as is. Otherwise this function attempts to parse the creation 
+    time from the file name (see parse_name_date). If parsing fails, it falls back to the 
     provided 'createdTime' metadata from Google Drive. It then compares 
     the parsed date and the 'createdTime' and returns the earlier of the two.
 
     """
 
-    # Initialize variables
-    utils_date = None
-    extracted_utils_date = None
-    
-    # Get the truncated creation time without timezone info
-    created_time = file["createdTime"][:-5]
-    modified_time = file["modifiedTime"][:-5]
+    # The camera knows best when the photo was taken
+    captured = capture_time(file)
+    if captured is not None and captured >= CUTOFF:
+        return str(captured).replace(":", "_")
+
+    # Get the creation time without milliseconds and timezone info
+    created_time = datetime.fromisoformat(file["createdTime"][:19])
     
     # Extract file name without extension
     fname = file["name"].split(".")[0]
-    
+
+    # Attempt to parse date from file name
+    name_date = parse_name_date(fname)
+
+    # dateutil parser has weird problem where it passes numbers such as 
+    # 567 and converts it to 0567-07-15 00:00:00 so, since I know my files
+    # aren't older than 2014, let's instead use modified time
+    if name_date is not None and name_date < CUTOFF:
+        name_date = datetime.fromisoformat(file["modifiedTime"][:19])
+
+    # Compare parsed and fallback dates, return the earlier one
+    # ":" isn't allowed in file names in windows os
+    if name_date is None:
+        return str(created_time).replace(":", "_")
+    return str(min(name_date, created_time)).replace(":", "_")
+
+def capture_time(file: Dict) -> Optional[datetime]:
+    """
+    Returns the EXIF capture time stored in the metadata of a file.
+
+    Args:
+    - file (dict): Dictionary containing metadata of the file, with the capture
+    time (if any) in 'imageMediaMetadata.time'.
+
+    Returns:
+    - datetime: The capture time, None if there's none or it's unreadable.
+    """
+
+    time = file.get("imageMediaMetadata", {}).get("time")
+
     try:
+        return datetime.strptime(time, EXIF_DATE_FORMAT) if time else None
+    except ValueError:
+        return None
 
-        # Attempt to parse date from file name
-        parsed_date = parser.parse(fname, fuzzy=True)
-
-        # Format parsed date to standard datetime string
-        utils_date = parsed_date.strftime("%Y-%m-%dT%H:%M:%S")
-        
-        # Convert formatted date string to datetime object
-        utils_date = datetime.strptime(utils_date, "%Y-%m-%dT%H:%M:%S")
-
-        # dateutil parser has weird problem where it passes numbers such as 
-        # 567 and converts it to 0567-07-15 00:00:00 so, since I know my files
-        # aren't older than 2014, let's instead use modified time using an if
-        # condition
-        if utils_date < datetime.strptime("2014-01-01T00:00:00", "%Y-%m-%dT%H:%M:%S"):
-            utils_date = datetime.strptime(modified_time, "%Y-%m-%dT%H:%M:%S")
-
-    except Exception as e:
-
-        # If parsing fails, fallback to the provided 'createdTime' from metadata
-        utils_date = datetime.strptime(created_time, "%Y-%m-%dT%H:%M:%S")
-        
-        # Attempt to match and extract date from file name using custom format matching function
-        extracted_utils_date = match_dates_format(fname)
-        
-    else:
-
-        # If parsing succeeds, use the provided 'createdTime' as fallback
-        extracted_utils_date = datetime.strptime(created_time, "%Y-%m-%dT%H:%M:%S")
-        
-    finally:
-
-        # Compare parsed and fallback dates, return the earlier one
-        # ":" isn't allowed in file names in windows os
-        if extracted_utils_date is None:
-            return str(utils_date).replace(":", "_")
-        return str(min(utils_date, extracted_utils_date)).replace(":", "_")
-
-def match_dates_format(fname:str) -> Optional[datetime]:
+def resolve_created_times(files: List[Dict]) -> List[str]:
+    """
+    Determines the actual creation time of every file of a listing in one pass.
+
+    Args:
+    - files (list): Metadata of the files, as returned by get_files_from_folder.
+
+    Returns:
+    - list: The creation time of every file, same as get_actual_createdTime 
+            would return, in the order of files.
+
+    Meant to run once over the whole listing before any download starts, so 
+    the downloads aren't held up by date parsing. Every distinct file name is 
+    parsed only once (parse_name_date is memoized).
+    """
+
+    created_times = [get_actual_createdTime(file) for file in files]
+
+    print(f"\n==== Resolved the creation time of {len(files)} file(s). ====\n")
+
+    return created_times
+
+@lru_cache(maxsize=65536)
+def parse_name_date(fname: str) -> Optional[datetime]:
+    """
+    Extracts the date from a file name, memoized by file name.
+
+    Args:
+    - fname (str): The file name (without extension).
+
+    Returns:
+    - datetime: The extracted date or None if no date is found.
+
+    The precompiled pattern of the known formats is tried first, since it
+    covers nearly all of the files and is much cheaper. dateutil's fuzzy
+    parser is only the last resort, and it also fills in the time of names
+    where the pattern only found a date (IMG-20200601-WA0030, WhatsApp's
+    "2020-05-06 at 10.11.12"), as long as it agrees on the date.
+    """
+
+    # Known formats first
+    date = match_dates_format(fname, require_time=True)
+    if date is not None:
+        return date
+
+    # Last resort
+    try:
+        fuzzy = parser.parse(fname, fuzzy=True).replace(tzinfo=None, microsecond=0)
+    except (ValueError, OverflowError):
+        fuzzy = None
+
+    # A date without its time, unless dateutil found the same date with one
+    date = match_dates_format(fname)
+    if date is None or (fuzzy is not None and fuzzy.date() == date.date()):
+        return fuzzy
+    return date
+
+def match_dates_format(fname:str, require_time: bool = False) -> Optional[datetime]:
     """
     Extracts date from the filename and returns it in ISO 8601 
     format (YYYY-MM-DDTHH:MM:SS).
 
     Args:
     - fname (str): The filename to extract the date from.
+    - require_time (bool): Skip the matches without a time. Defaults to False.
 
     Returns:
     - date: The extracted date in ISO 8601 format or None if no date is found.
     """
 
-    # Known patters found in the names of the files
-    patterns = [
-        r"(20\d{2})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})",
-        r"(20\d{2})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})(?:\d{2,3})",
-        r"(20\d{2})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-(?:\d{2,3})",
-        r"(20\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_(?:\d{2,3})"
-    ]
+    # Looping through each match of the known patterns
+    for match in DATE_PATTERN.finditer(fname):
 
-    # Looping through each pattern
-    for pattern in patterns:
-        
-        # searching for matches
-        matches = re.search(pattern, fname)
-        
-        # if match(es) is found
-        if matches:
-            # returns datetime object with specific format
-            return datetime.strptime("{0}-{1}-{2}T{3}:{4}:{5}".format(
-                *matches.groups()), "%Y-%m-%dT%H:%M:%S")
+        # Time is optional (e.g. IMG-20200601-WA0030)
+        parts = match.group("year", "month", "day", "hour", "minute", "second")
+        if require_time and parts[3] is None:
+            continue
+
+        try:
+            # returns datetime object
+            return datetime(*(int(part) for part in parts if part is not None))
+        except ValueError:
+            # Not a valid date (e.g. month 13), try the next match
+            continue
 
     # else returns None
-    return None
\ No newline at end of file
+    return None
+
+def benchmark(rounds: int = 2000) -> None:
+    """
+    Times the date extraction over the known patterns.
+
+    Args:
+    - rounds (int): Number of passes over KNOWN_FILENAMES.
+
+    Compares dateutil's fuzzy parser (how dates used to be extracted first),
+    the precompiled pattern without memoization and the memoized engine.
+    """
+
+    def fuzzy(fname: str) -> Optional[datetime]:
+        try:
+            return parser.parse(fname, fuzzy=True)
+        except (ValueError, OverflowError):
+            return None
+
+    candidates = [
+        ("dateutil fuzzy", fuzzy),
+        ("compiled pattern", parse_name_date.__wrapped__),
+        ("memoized", parse_name_date),
+    ]
+
+    print(f"\n==== {rounds} x {len(KNOWN_FILENAMES)} file names ====\n")
+
+    for label, func in candidates:
+        start = perf_counter()
+        for _ in range(rounds):
+            for fname in KNOWN_FILENAMES:
+                func(fname)
+        elapsed = perf_counter() - start
+        print(f"{label:<20} {elapsed:8.3f}s  "
+              f"{elapsed / (rounds * len(KNOWN_FILENAMES)) * 1e6:8.2f}us/name")
+
+    print("\nExtracted dates:")
+    for fname in KNOWN_FILENAMES:
+        date = parse_name_date(fname)
+        check = "" if date == KNOWN_DATES[fname] else f"  **** EXPECTED {KNOWN_DATES[fname]} ****"
+        print(f"{fname:<70} {date}{check}")
+
+if __name__ == "__main__":
+    benchmark()
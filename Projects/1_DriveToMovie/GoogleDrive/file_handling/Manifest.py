@@ -0,0 +1,149 @@
+"""
+Local manifest of the files downloaded from a Drive folder.
+
+Every run used to download the whole folder again. The manifest remembers, for
+every downloaded file, the metadata Drive gave us (id, md5Checksum, size,
+modifiedTime, ...) and the name it was saved under, so the next run only has to
+download what is new or changed.
+
+It also keeps the start page token of Drive's changes feed. With it, the next
+run asks Drive for the changes since the last run instead of listing the whole
+folder again.
+
+    resources\\manifests\\<folder_name>.json
+
+    {
+        "start_page_token": "12345",
+        "files": {
+            "<file id>": {<Drive metadata>, "local_name": "<saved filename>"},
+            ...
+        }
+    }
+"""
+
+import json
+from os import path, makedirs, replace
+from typing import Dict, List
+
+# Where the manifests are kept
+MANIFEST_DIR = "resources\\manifests"
+
+# Fields which tell whether a file changed on Drive
+CHANGE_FIELDS = ("md5Checksum", "size", "modifiedTime")
+
+
+def manifest_path(folder_name: str) -> str:
+
+    """
+    Returns the path of the manifest of a folder.
+
+    Args:
+        folder_name (str): The name of the Drive folder.
+
+    Returns:
+        str: The path of the manifest.
+    """
+    return path.join(MANIFEST_DIR, f"{folder_name}.json")
+
+
+def load_manifest(folder_name: str) -> Dict:
+
+    """
+    Loads the manifest of a folder, an empty one if there's none yet.
+
+    Args:
+        folder_name (str): The name of the Drive folder.
+
+    Returns:
+        dict: The manifest.
+    """
+
+    try:
+        with open(manifest_path(folder_name)) as f:
+            return json.load(f)
+
+    except FileNotFoundError:
+        return {"start_page_token": None, "files": {}}
+
+
+def save_manifest(folder_name: str, manifest: Dict) -> None:
+
+    """
+    Saves the manifest of a folder.
+
+    Args:
+        folder_name (str): The name of the Drive folder.
+        manifest (dict): The manifest.
+
+    Returns:
+        None
+    """
+
+    # If the directory doesn't exist, create it
+    if not path.exists(MANIFEST_DIR):
+        makedirs(MANIFEST_DIR)
+
+    # Write to a temporary file first so a crash never leaves half a manifest
+    file_path = manifest_path(folder_name)
+    with open(f"{file_path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    replace(f"{file_path}.tmp", file_path)
+
+
+def is_changed(file: Dict, entry: Dict) -> bool:
+
+    """
+    Checks whether a file changed on Drive since it was downloaded.
+
+    Args:
+        file (dict): The metadata of the file from Drive.
+        entry (dict): The manifest entry of the file, None if it's new.
+
+    Returns:
+        bool: True if the file is new or changed, False otherwise.
+    """
+
+    if entry is None:
+        return True
+
+    return any(file.get(field) != entry.get(field) for field in CHANGE_FIELDS)
+
+
+def apply_changes(manifest: Dict, changes: List[Dict], folder_ids: List[str],
+    extensions: List[str]) -> List[Dict]:
+
+    """
+    Builds the current listing of a folder from the manifest and the changes
+    of the drive since the last run.
+
+    Args:
+        manifest (dict): The manifest of the folder.
+        changes (list): The changes returned by GoogleDriveClient.get_changes.
+        folder_ids (list): List of folder IDs in Google Drive.
+        extensions (list): List of MIME types of the desired files.
+
+    Returns:
+        list: The metadata of the files currently in the folder.
+    """
+
+    # Start from what was in the folder last time
+    files = {fid: {k: v for k, v in entry.items() if k != "local_name"}
+        for fid, entry in manifest["files"].items()}
+
+    for change in changes:
+        file = change.get("file")
+
+        # Same filters as GoogleDriveClient.get_files_from_folder
+        wanted = (not change.get("removed") and file is not None
+            and not file.get("trashed")
+            and any(parent in folder_ids for parent in file.get("parents", []))
+            and file["mimeType"] in extensions
+            and "raw" not in file["name"])
+
+        if wanted:
+            file.pop("trashed", None)
+            files[change["fileId"]] = file
+        else:
+            files.pop(change["fileId"], None)
+
+    return list(files.values())
@@ -0,0 +1,93 @@
+"""
+Ordering index of the images of a folder.
+
+The order of the video used to be worked out again by every stage: image_modifier
+listed the download folder and parsed the date back out of every filename, and
+video_writer listed the folder of altered images and sorted it by number. The
+stage which writes a folder now also writes the order of its files next to it,
+and the next stage reads it instead of scanning and re-parsing:
+
+    resources\\downloaded_folder\\<folder_name>.order.json            (manage_files)
+    resources\\downloaded_folder\\modified_<folder_name>.order.json   (image_modifier)
+
+    {"files": ["<filename>", ...]}
+
+The downloads are ordered by capture time (get_actual_createdTime), ties broken
+by file id, the same order stream_pipeline uses. The index lives beside the
+folder rather than in it so it never shows up among the images.
+"""
+
+import json
+from os import path, replace
+from typing import List, Optional, Tuple
+
+
+def index_path(folder_path: str) -> str:
+
+    """
+    Returns the path of the ordering index of a folder.
+
+    Args:
+        folder_path (str): The path to the folder of images.
+
+    Returns:
+        str: The path of the ordering index.
+    """
+    return f"{path.normpath(folder_path)}.order.json"
+
+
+def save_order(folder_path: str, filenames: List[str]) -> None:
+
+    """
+    Saves the ordering index of a folder.
+
+    Args:
+        folder_path (str): The path to the folder of images.
+        filenames (list): The filenames of the images, in the order of the video.
+
+    Returns:
+        None
+    """
+
+    # Write to a temporary file first so a crash never leaves half an index
+    file_path = index_path(folder_path)
+    with open(f"{file_path}.tmp", "w") as f:
+        json.dump({"files": filenames}, f, indent=1)
+    replace(f"{file_path}.tmp", file_path)
+
+    print(f"\n==== Saved the order of {len(filenames)} file(s) to {file_path} ====\n")
+
+
+def load_order(folder_path: str) -> Optional[List[str]]:
+
+    """
+    Loads the ordering index of a folder.
+
+    Args:
+        folder_path (str): The path to the folder of images.
+
+    Returns:
+        list: The filenames of the images in the order of the video, None if the
+              folder has no index.
+    """
+
+    try:
+        with open(index_path(folder_path)) as f:
+            return json.load(f)["files"]
+
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def capture_order(entries: List[Tuple[str, str, str]]) -> List[str]:
+
+    """
+    Orders downloaded files by their capture time.
+
+    Args:
+        entries (list): (capture time, file id, local filename) of every file.
+
+    Returns:
+        list: The local filenames, ordered by capture time then file id.
+    """
+    return [local_name for _, _, local_name in sorted(entries)]
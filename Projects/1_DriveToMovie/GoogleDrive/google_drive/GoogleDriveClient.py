@@ -1,13 +1,92 @@
 import re
+import json
+import httplib2
+from threading import local
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from argparse import ArgumentParser, Namespace
-from os import path, listdir, makedirs
+from os import path, listdir, makedirs, cpu_count
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document, Resource
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.http import MediaIoBaseDownload
-from typing import List, Dict, Generator
+from typing import List, Dict, Generator, Tuple, Set
+
+# Metadata fields retrieved for every file
+FILE_FIELDS = "id, name, mimeType, createdTime, modifiedTime, parents, md5Checksum, size"
+
+# Same, plus the capture time Drive reads from the EXIF of the images
+EXIF_FIELDS = f"{FILE_FIELDS}, imageMediaMetadata(time)"
+
+# Folders searched together in a single query
+FOLDERS_PER_QUERY = 50
+
+# MIME type of Google Drive folders
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+
+class ServicePool:
+
+    """
+    Hands out one Google Drive API service object per thread.
+
+    Building a service parses the discovery document and opens a new HTTP 
+    transport, so building one per downloaded file adds up quickly. Here the 
+    discovery document is parsed once, and every thread builds its service only 
+    the first time it asks for one. The service keeps its httplib2 connection 
+    alive between requests, so a thread's downloads share a warm connection 
+    (httplib2 isn't thread-safe, hence one per thread rather than one for all).
+
+    Attributes:
+    - creds (Credentials): The Google OAuth2 credentials object.
+    - timeout (int): Socket timeout of the HTTP transports, in seconds.
+    - discovery_doc (dict): The parsed discovery document of the Drive API.
+    """
+
+    def __init__(self, creds: Credentials, timeout: int = 60) -> None:
+
+        """
+        Initializes ServicePool by parsing the discovery document of the Drive API.
+        """
+
+        self.creds = creds
+        self.timeout = timeout
+
+        # Discovery document shipped with google-api-python-client, None if 
+        # missing (the service is then built the usual way)
+        static_doc = get_static_doc("drive", "v3")
+        self.discovery_doc = json.loads(static_doc) if static_doc else None
+
+        # Services of the threads
+        self.local = local()
+
+    def get(self) -> Resource:
+
+        """
+        Returns the service of the calling thread, building it on first use.
+
+        Returns:
+        - Resource: The Google Drive API service object.
+        """
+
+        service = getattr(self.local, "service", None)
+
+        if service is None:
+            # Keep-alive transport of this thread
+            http = AuthorizedHttp(self.creds, http=httplib2.Http(timeout=self.timeout))
+
+            if self.discovery_doc is not None:
+                service = build_from_document(self.discovery_doc, http=http)
+            else:
+                service = build("drive", "v3", http=http)
+
+            self.local.service = service
+
+        return service
+
 
 class GoogleDriveClient:
 
@@ -138,18 +217,29 @@ class GoogleDriveClient:
             # filtering
             print(f'\n==== Searching for folders with name - {folder_name}... ====\n')
 
-            # Execute service request entry
-            response = self.service.files().list(
-                q=f"name = '{folder_name}' and \
-                      mimeType = 'application/vnd.google-apps.folder'",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)',
-                pageToken=None
-            ).execute()
+            # Initialize items and page_token for pagination
+            items = []
+            page_token = None
+
+            while True:
 
-            # Using get method to get the files attribute from the resonse
-            # generator
-            items = response.get("files", [])
+                # Execute service request entry
+                response = self.service.files().list(
+                    q=f"name = '{folder_name}' and \
+                          mimeType = '{FOLDER_MIME_TYPE}'",
+                    spaces='drive',
+                    fields='nextPageToken, files(id, name)',
+                    pageToken=page_token
+                ).execute()
+
+                # Using get method to get the files attribute from the resonse
+                # generator
+                items.extend(response.get("files", []))
+
+                # Update page_token for the next page, break out if none left
+                page_token = response.get('nextPageToken', None)
+                if not page_token:
+                    break
 
             # Check if files have been found or not, if any
             if not items:
@@ -180,7 +270,8 @@ class GoogleDriveClient:
         return folder_ids
 
     def get_files_from_folder(self, folder_ids: List[str], 
-        extensions: List[str]) -> List[Dict[str, str]]:
+        extensions: List[str], fields: str = FILE_FIELDS, 
+        page_size: int = 1000) -> List[Dict[str, str]]:
         
         """
         Retrieves files from specified Google Drive folders.
@@ -188,20 +279,35 @@ class GoogleDriveClient:
         Args:
         - folder_ids (list): List of folder IDs in Google Drive.
         - extensions (list): List of file extensions to search for.
+        - fields (str): Metadata fields to retrieve for every file. Defaults to 
+                        FILE_FIELDS.
+        - page_size (int): Number of files per page. Defaults to 1000 (the 
+                           maximum Drive allows).
 
         Returns:
         - list: A list of files in the specified folders.
+
+        Note - The folders are searched together with a single query 
+               ('a' in parents or 'b' in parents ...), split in groups of 
+               FOLDERS_PER_QUERY folders to keep the query short.
         """
 
         # Initialize files list
         files = []
 
+        # Combine mimeType queries with 'or'
+        mime_query_string = " or ".join(f"mimeType='{e}'" for e in extensions)
+
         try:
-            # Loop through each folder ID
-            for folder_id in folder_ids:
+            # Loop through the groups of folder IDs
+            for i in range(0, len(folder_ids), FOLDERS_PER_QUERY):
+
+                # Combine parent queries with 'or'
+                group = folder_ids[i:i + FOLDERS_PER_QUERY]
+                parents_query_string = " or ".join(f"'{f}' in parents" for f in group)
                 
                 # Display search message
-                print(f"\n==== Searching for image files in the folder(s) - {folder_id}... ====\n")
+                print(f"\n==== Searching for image files in the folder(s) - {group}... ====\n")
                 
                 # Initialize page_token for pagination
                 page_token = None  
@@ -210,17 +316,13 @@ class GoogleDriveClient:
 
                     print("Searching...")
 
-                    # Combine mimeType queries with 'or'
-                    mime_query_string = " or ".join(f"mimeType='{e}'" for e in extensions)
-
                     # Execute service request query
                     response = self.service.files().list(
-                        q=f"('{folder_id}' in parents) and \
+                        q=f"({parents_query_string}) and (trashed = false) and \
                             (not name contains 'raw') and \
                             ({mime_query_string})",
-                        pageSize=100,
-                        fields='nextPageToken, files(id, name, mimeType, createdTime, \
-                                modifiedTime, parents)',
+                        pageSize=page_size,
+                        fields=f'nextPageToken, files({fields})',
                         pageToken=page_token
                     ).execute()
 
@@ -234,7 +336,7 @@ class GoogleDriveClient:
                     if not page_token:
                         break
 
-                print(f"\n ==== Done Searching for image files in the folders - {folder_ids}... ====\n")
+            print(f"\n ==== Done Searching for image files in the folders - {folder_ids}... ====\n")
 
         except HttpError as error:
             print(f"\n\n**** AN ERROR HAS OCCURRED: {error} ****\n\n")
@@ -247,6 +349,192 @@ class GoogleDriveClient:
         # Return the list of files retrieved
         return files
 
+    def walk_folder_tree(self, folder_ids: List[str], extensions: List[str], 
+        fields: str = FILE_FIELDS, workers: int = 4, 
+        page_size: int = 1000) -> Generator[Dict[str, str], None, None]:
+        
+        """
+        Retrieves files from specified Google Drive folders and all of their 
+        subfolders.
+
+        Args:
+        - folder_ids (list): List of folder IDs in Google Drive.
+        - extensions (list): List of file extensions to search for.
+        - fields (str): Metadata fields to retrieve for every file, must include 
+                        id and mimeType. Defaults to FILE_FIELDS.
+        - workers (int): Number of folders listed at once. Defaults to 4.
+        - page_size (int): Number of files per page. Defaults to 1000.
+
+        Returns:
+        - generator: A generator yielding the files as their folders are listed.
+
+        Note - The tree is walked level by level, with subfolders listed 
+               concurrently by a bounded pool of threads. Files are yielded as 
+               soon as their folder is listed, so downloads can start before the 
+               whole tree has been walked.
+        """
+
+        # Google Drive Services of the listing threads
+        services = ServicePool(self.creds)
+
+        # Folders and files already seen (a file may have several parents)
+        seen_folders = set(folder_ids)
+        seen_files = set()
+
+        print(f"\n==== Walking the folder tree(s) of - {folder_ids}... ====\n")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(self.list_folder, services, folder_id, 
+                extensions, fields, page_size) for folder_id in folder_ids}
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    files, subfolders = future.result()
+
+                    # Queue the subfolders which haven't been seen yet
+                    for subfolder in subfolders - seen_folders:
+                        seen_folders.add(subfolder)
+                        pending.add(executor.submit(self.list_folder, services, 
+                            subfolder, extensions, fields, page_size))
+
+                    for file in files:
+                        if file["id"] not in seen_files:
+                            seen_files.add(file["id"])
+                            yield file
+
+        print(f"\n==== Done walking {len(seen_folders)} folder(s), "
+              f"{len(seen_files)} file(s) found. ====\n")
+
+    def list_folder(self, services: ServicePool, folder_id: str, 
+        extensions: List[str], fields: str = FILE_FIELDS, 
+        page_size: int = 1000) -> Tuple[List[Dict[str, str]], Set[str]]:
+        
+        """
+        Retrieves the desired files and the subfolders directly in a folder.
+
+        Args:
+        - services (ServicePool): The Google Drive API services of the threads.
+        - folder_id (str): The ID of the folder.
+        - extensions (list): List of file extensions to search for.
+        - fields (str): Metadata fields to retrieve for every file.
+        - page_size (int): Number of files per page.
+
+        Returns:
+        - tuple: The files and the IDs of the subfolders of the folder.
+        """
+
+        # Initialize files and subfolders
+        files, subfolders = [], set()
+
+        # Combine mimeType queries with 'or'
+        mime_query_string = " or ".join(f"mimeType='{e}'" for e in extensions)
+
+        # Initialize page_token for pagination
+        page_token = None
+
+        try:
+            while True:
+
+                # Execute service request query, subfolders and desired files
+                response = services.get().files().list(
+                    q=f"('{folder_id}' in parents) and (trashed = false) and \
+                        ((mimeType = '{FOLDER_MIME_TYPE}') or \
+                         ((not name contains 'raw') and ({mime_query_string})))",
+                    pageSize=page_size,
+                    fields=f'nextPageToken, files({fields})',
+                    pageToken=page_token
+                ).execute()
+
+                # Separate subfolders from files
+                for item in response.get('files', []):
+                    if item["mimeType"] == FOLDER_MIME_TYPE:
+                        subfolders.add(item["id"])
+                    else:
+                        files.append(item)
+
+                # Update page_token for the next page, break out if none left
+                page_token = response.get('nextPageToken', None)
+                if not page_token:
+                    break
+
+        except HttpError as error:
+            print(f"\n\n**** AN ERROR HAS OCCURRED: {error} ****\n\n")
+            raise
+
+        print(f"Folder {folder_id}: {len(files)} file(s), {len(subfolders)} subfolder(s).")
+
+        return files, subfolders
+
+    def get_start_page_token(self) -> str:
+        
+        """
+        Retrieves the token from which later changes of the drive are listed.
+
+        Returns:
+        - str: The start page token.
+        """
+
+        try:
+            response = self.service.changes().getStartPageToken().execute()
+
+        except HttpError as error:
+            print(f"\n\n**** AN ERROR HAS OCCURRED: {error} ****\n\n")
+            raise
+
+        return response["startPageToken"]
+
+    def get_changes(self, page_token: str, 
+        fields: str = FILE_FIELDS) -> Tuple[List[Dict], str]:
+        
+        """
+        Retrieves the changes of the drive since a start page token.
+
+        Args:
+        - page_token (str): The start page token saved by the previous run.
+        - fields (str, optional): Metadata fields retrieved for every changed 
+                                  file. Defaults to FILE_FIELDS.
+
+        Returns:
+        - tuple: A list of changes (fileId, removed and the file metadata) and 
+                 the start page token for the next run.
+        """
+
+        # Initialize changes list
+        changes = []
+
+        print("\n==== Searching for changes since the last run... ====\n")
+
+        try:
+            while True:
+
+                # Execute service request query
+                response = self.service.changes().list(
+                    pageToken=page_token,
+                    spaces='drive',
+                    pageSize=1000,
+                    fields=f'nextPageToken, newStartPageToken, changes(fileId, removed, \
+                             file({fields}, trashed))'
+                ).execute()
+
+                # Extend changes list with results from current page
+                changes.extend(response.get('changes', []))
+
+                # The last page carries the token for the next run
+                if 'newStartPageToken' in response:
+                    break
+
+                page_token = response['nextPageToken']
+
+        except HttpError as error:
+            print(f"\n\n**** AN ERROR HAS OCCURRED: {error} ****\n\n")
+            raise
+
+        print(f"\n==== {len(changes)} change(s) found. ====\n")
+
+        return changes, response['newStartPageToken']
+
 def is_valid_name(fname: str) -> bool:
     
     """
@@ -325,15 +613,15 @@ def take_arguements() -> Namespace:
         "-f",
         "--folder_name", 
         type=str,
-        required=True,
-        help="Name(case-sensitive) of the Google Drive Folder with desired files."
+        help="Name(case-sensitive) of the Google Drive Folder with desired files. "
+             "Required, except for --role worker."
     )
     parser.add_argument(
         "-d",
         "--duration_video_sec", 
         type=int,
-        required=True,
-        help="Duration of the desired video, audio(in secs)."
+        help="Duration of the desired video, audio(in secs). Required, except "
+             "for --role worker."
     )
     parser.add_argument(
         "-b",
@@ -349,6 +637,176 @@ def take_arguements() -> Namespace:
         default=['image/jpeg', 'image/png', 'image/jpg', 'image/heic', 'image/heif'],
         help="List of MIME types/extensions of the desired files."
     )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Download, alter and write the images to the video in a single "
+             "streaming pass."
+    )
+    parser.add_argument(
+        "-q",
+        "--queue_size",
+        type=int,
+        default=16,
+        help="Maximum number of images in flight while streaming."
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=cpu_count(),
+        help="Number of processes altering the images."
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=8,
+        help="Number of images handed to an altering process at once."
+    )
+    parser.add_argument(
+        "-m",
+        "--in_memory",
+        action="store_true",
+        help="Hand the altered images to the video writer in memory instead "
+             "of writing them to disk and reading them back."
+    )
+    parser.add_argument(
+        "--spill",
+        action="store_true",
+        help="With --in_memory, also save the altered images to disk."
+    )
+    parser.add_argument(
+        "--frame_cache",
+        action="store_true",
+        help="Keep the altered images in a persistent cache and only alter "
+             "the images which changed since the last run."
+    )
+    parser.add_argument(
+        "--cache_size_gb",
+        type=float,
+        default=10,
+        help="Size cap of the frame cache (in GB)."
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Only download the files which are new or changed since the "
+             "last run, using a local manifest."
+    )
+    parser.add_argument(
+        "--download_workers",
+        type=int,
+        default=8,
+        help="Number of concurrent downloads to start with."
+    )
+    parser.add_argument(
+        "--max_download_workers",
+        type=int,
+        default=32,
+        help="Most concurrent downloads the download scheduler may ramp up to."
+    )
+    parser.add_argument(
+        "--download_chunk_mb",
+        type=int,
+        default=8,
+        help="Megabytes requested at once while downloading a file."
+    )
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="Also look for files in the subfolders of the folder(s)."
+    )
+    parser.add_argument(
+        "--list_workers",
+        type=int,
+        default=4,
+        help="Number of folders listed at once when looking recursively."
+    )
+    parser.add_argument(
+        "--heic_workers",
+        type=int,
+        default=2,
+        help="Number of processes altering the HEIC images while streaming."
+    )
+    parser.add_argument(
+        "--encoder",
+        choices=["opencv", "ffmpeg"],
+        default="opencv",
+        help="Video encoder. 'ffmpeg' encodes, adds the audio and enhances the "
+             "video in a single pass."
+    )
+    parser.add_argument(
+        "--crf",
+        type=int,
+        default=None,
+        help="Constant rate factor of the ffmpeg encoder, used instead of the bitrate."
+    )
+    parser.add_argument(
+        "--transition",
+        choices=["cut", "crossfade", "kenburns", "both"],
+        default="cut",
+        help="Transition between the images: hard cuts, crossfades, a slow zoom "
+             "(Ken Burns) on every image, or both."
+    )
+    parser.add_argument(
+        "--playlist",
+        nargs="+",
+        metavar="TRACK",
+        help="Audio files (in resources\\audios) played one after the other, "
+             "crossfaded and loudness normalized, instead of audio.mp3."
+    )
+    parser.add_argument(
+        "--beat_sync",
+        action="store_true",
+        help="Move the cuts between the images onto the beats of the audio."
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        help="Write the video in this many segments, each in its own process, "
+             "joined without re-encoding (0 for one per core)."
+    )
+    parser.add_argument(
+        "--role",
+        choices=["local", "coordinator", "worker"],
+        default="local",
+        help="Render everything here (local), split the render into segment "
+             "jobs for workers on other nodes (coordinator), or render the "
+             "segment jobs of a coordinator (worker)."
+    )
+    parser.add_argument(
+        "--queue_path",
+        type=str,
+        default="resources\\render_queue.sqlite",
+        help="Job queue shared by the coordinator and its workers, on storage "
+             "every node sees (default: resources\\render_queue.sqlite)."
+    )
+    parser.add_argument(
+        "--local_workers",
+        type=int,
+        default=0,
+        help="Number of worker processes the coordinator starts on its own node "
+             "(default: 0)."
+    )
+    parser.add_argument(
+        "--exif",
+        action="store_true",
+        help="Order the images by their EXIF capture time where they have one."
+    )
+
+    args = parser.parse_args()
+
+    # The streaming pass renders on its own, without these
+    ignored = {
+        "--role": args.role != "local",
+        "--frame_cache": args.frame_cache,
+        "--segments": args.segments is not None,
+    }
+    for flag, used in ignored.items():
+        if args.stream and used:
+            parser.error(f"--stream can't be combined with {flag}")
 
     # Return Namespace object
-    return parser.parse_args()
+    return args
@@ -0,0 +1,152 @@
+"""
+Persistent cache of altered images.
+
+Re-rendering a folder where only a few photos changed used to alter every image
+from scratch. The expensive part (decoding, resizing and padding the image into
+its frame) only depends on the original file and the size of the frame, so the
+frame is stored on disk before it's desaturated, under a key built from exactly
+those:
+
+    - the Drive file id (the part of the downloaded filename before the date)
+    - the Drive 'modifiedTime' (the downloaded file carries it as its mtime)
+    - the size of the downloaded file
+    - the target size (max_h, max_w)
+
+The desaturation depends on the position of the image in the video, which
+moves whenever a photo is added or removed, so it's applied after every lookup
+instead (a single cv2.transform). Entries are plain .npy files, so loading one
+is a single read. Every hit touches
+the entry, and once the cache grows past its size cap the least recently used
+entries are removed first.
+"""
+
+import re
+import numpy as np
+from hashlib import sha1
+from os import path, makedirs, listdir, stat, utime, remove, replace, getpid
+from typing import Optional, Tuple
+
+# Date part of the downloaded filenames, "{fid}_YYYY-MM-DD HH_MM_SS.ext"
+DATE_PATTERN = re.compile(r"_20\d{2}-\d{2}-\d{2} \d{2}_\d{2}_\d{2}")
+
+
+class FrameCache:
+
+    """
+    A size capped, least recently used cache of altered images on disk.
+
+    Attributes:
+    - cache_dir (str): Directory where the altered images are stored.
+    - max_bytes (int): Size cap of the cache, in bytes.
+    """
+
+    def __init__(self, cache_dir: str = "resources\\frame_cache",
+        max_bytes: int = 10 * 1024 ** 3) -> None:
+
+        """
+        Initializes FrameCache, creating the cache directory if needed.
+        """
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        # If the directory doesn't exist, create it
+        if not path.exists(self.cache_dir):
+            makedirs(self.cache_dir)
+
+    def key(self, fname: str, size: Tuple[int, int] = (1080, 1920)) -> str:
+
+        """
+        Builds the cache key of a frame.
+
+        Args:
+        - fname (str): Path to the downloaded image.
+        - size (tuple): Target height and width of the frame.
+
+        Returns:
+        - str: The cache key.
+        """
+
+        # File id is whatever comes before the date in the filename
+        basename = path.basename(fname)
+        match = DATE_PATTERN.search(basename)
+        fid = basename[:match.start()] if match else basename
+
+        # The downloaded file carries Drive's modifiedTime as its mtime
+        info = stat(fname)
+
+        return sha1(f"{fid}|{info.st_mtime_ns}|{info.st_size}|{size}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+
+        """
+        Loads an altered image from the cache.
+
+        Args:
+        - key (str): The cache key.
+
+        Returns:
+        - np.ndarray: The altered image, None if it isn't cached.
+        """
+
+        entry = path.join(self.cache_dir, f"{key}.npy")
+
+        try:
+            img = np.load(entry)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # Mark the entry as recently used
+        utime(entry)
+
+        return img
+
+    def put(self, key: str, img: np.ndarray) -> None:
+
+        """
+        Stores an altered image in the cache.
+
+        Args:
+        - key (str): The cache key.
+        - img (np.ndarray): The altered image.
+
+        Returns:
+        - None
+        """
+
+        entry = path.join(self.cache_dir, f"{key}.npy")
+
+        # Write to a temporary file first so other processes never load half
+        # an entry
+        tmp_entry = f"{entry}.{getpid()}.tmp"
+        with open(tmp_entry, "wb") as f:
+            np.save(f, img)
+        replace(tmp_entry, entry)
+
+    def evict(self) -> None:
+
+        """
+        Removes the least recently used entries until the cache fits its size cap.
+
+        Returns:
+        - None
+        """
+
+        # (last used, size, path) of every entry
+        entries = []
+        for name in listdir(self.cache_dir):
+            if name.endswith(".npy"):
+                entry = path.join(self.cache_dir, name)
+                info = stat(entry)
+                entries.append((info.st_mtime, info.st_size, entry))
+
+        total_bytes = sum(size for _, size, _ in entries)
+
+        # Oldest first
+        for _, size, entry in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            remove(entry)
+            total_bytes -= size
+
+        print(f"\n==== Frame cache holds {total_bytes / 1024 ** 2:.0f} MB ====\n")
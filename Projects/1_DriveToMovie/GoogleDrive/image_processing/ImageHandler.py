@@ -1,11 +1,42 @@
 import cv2
 import re
 from sys import exit
+from time import perf_counter
+from threading import local
 import numpy as np
 from os import listdir, path, mkdir
-from typing import List, Dict, Generator
+from typing import List, Dict, Generator, Tuple, Optional, Iterable
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from pillow_heif import open_heif
+from PIL import Image
+from pillow_heif import open_heif, options as heif_options
+from FrameCache import FrameCache
+from DecodeTimings import DecodeTimings
+from OrderIndex import load_order, save_order
+
+# OpenCV flags decoding a JPEG at 1/8, 1/4 and 1/2 of its size
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), 
+    (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# EXIF orientations which swap the width and height of the image
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Luminance weights of the B, G and R channels, same as cv2.COLOR_BGR2GRAY
+GRAY_WEIGHTS = np.array([[0.114, 0.587, 0.299]], dtype=np.float32)
+
+# Frame buffers reused by image_alteration, one set per thread (and so per process)
+frame_buffers = local()
+
+# Decode timings of this process, per format
+decode_timings = DecodeTimings()
+
+# Only the primary image of a HEIC file is ever used, don't load the thumbnails 
+# and depth maps along with it
+heif_options.THUMBNAILS = False
+heif_options.DEPTH_IMAGES = False
+
+# Date part of the downloaded filenames, "sometext_YYYY-MM-DD HH_MM_SS.ext"
+FILENAME_DATE_PATTERN = re.compile(r"(20\d{2}-\d{2}-\d{2} \d{2}_\d{2}_\d{2})")
 
 
 def extract_date(filename: str) -> datetime:
@@ -23,11 +54,8 @@ def extract_date(filename: str) -> datetime:
     """
     
     try:
-        # Regular expression pattern to match the date and time in the filename
-        pattern = re.compile(r"(20\d{2}-\d{2}-\d{2} \d{2}_\d{2}_\d{2})")
-        
         # Search for the pattern in the filename
-        if match := pattern.search(filename):
+        if match := FILENAME_DATE_PATTERN.search(filename):
             # Replace underscores with colons and convert to datetime object
             return datetime.strptime(match.group(1).replace("_", ":"), 
                 "%Y-%m-%d %H:%M:%S")
@@ -40,7 +68,35 @@ def extract_date(filename: str) -> datetime:
     # Return None if no date is found or an error occurs
     return None
 
-def image_modifier(downloading_path: str) -> str:
+def sorted_images(downloading_path: str) -> List[str]:
+    
+    """
+    Lists the downloaded images of a directory in the order of the video.
+
+    Args:
+        downloading_path (str): The path to the directory containing the images.
+
+    Returns:
+        list: The sorted filenames, without unfinished (.part) downloads.
+
+    Note:
+        The order saved by manage_files (see OrderIndex) is used as is. Only 
+        folders without one are listed and sorted by the date in their 
+        filenames, the files without a date coming last.
+    """
+
+    if (order := load_order(downloading_path)) is not None:
+        return order
+
+    def date_key(file: str) -> Tuple[bool, datetime, str]:
+        date = extract_date(file)
+        return date is None, date or datetime.min, file
+
+    return sorted((file for file in listdir(downloading_path) 
+        if not file.endswith(".part")), key=date_key)
+
+def image_modifier(downloading_path: str, workers: int = 1, 
+    chunksize: int = 8, cache: Optional[FrameCache] = None) -> str:
     
     """
     Modifies images in a given directory by sorting them based on the 
@@ -49,9 +105,22 @@ def image_modifier(downloading_path: str) -> str:
     Args:
         downloading_path (str): The path to the directory containing the images 
                                 to be modified.
+        workers (int, optional): Number of processes altering the images. 
+                                 Defaults to 1 (no process pool).
+        chunksize (int, optional): Number of images handed to a process at once.
+                                   Defaults to 8.
+        cache (FrameCache, optional): Cache of altered images, only the images 
+                                      which aren't in it are altered. Defaults 
+                                      to None (no cache).
 
     Returns:
         str: The path to the directory containing the modified images.
+
+    Note:
+        The counter of every image is assigned from the sorted order before the 
+        images are handed out, so the output names and the desaturation ratio 
+        are the same whatever the number of workers. The order of the altered 
+        images is saved beside their directory for video_writer.
     """
     try:
         # If the directory doesn't exist, exit the workflow
@@ -60,47 +129,40 @@ def image_modifier(downloading_path: str) -> str:
             print(f"==== Exiting workflow. ====\n")
             exit()
 
-        split_path = downloading_path.split("\\")
         # Creating a new directory for altered images
-        root, folder = "\\".join(split_path[:-1]), split_path[-1]
-        modified_folder_path = path.join(root, f"modified_{folder}") 
-        
-        # If the directory doesn't exist, create it
-        if path.exists(modified_folder_path):
-            print(f"\n==== The directory {modified_folder_path} already exists. ====\n")
-        else:
-            mkdir(modified_folder_path)
+        modified_folder_path = modified_folder(downloading_path)
         
         # Sorting filenames based on dates
-        sorted_filenames = sorted(listdir(downloading_path), key=extract_date)
+        sorted_filenames = sorted_images(downloading_path)
 
         # Total number of files (used for desaturation)
         total_files = len(sorted_filenames)
         
         print("\n==== Altering images ====\n")
 
-        # Iterate over the sorted filenames
-        for counter, file in enumerate(sorted_filenames):
-            try:
-                # Altering the image
-                img_array = image_alteration(path.join(downloading_path, file), 
-                    counter + 1, total_files)
-
-                # Extracting extension
-                img_ext = file.split('.')[-1]
+        # One task per image, numbered in the sorted order
+        tasks = [(downloading_path, file, counter + 1, total_files, modified_folder_path, 
+            cache) for counter, file in enumerate(sorted_filenames)]
 
-                # .heic isn't supported by OpenCV, so converting it to jpg
-                if img_ext == 'heic':
-                    img_ext = "jpg"
+        if workers > 1:
+            # Fan the images out over a pool of processes
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(alter_and_save, tasks, chunksize=chunksize))
+        else:
+            # Iterate over the sorted filenames
+            results = [alter_and_save(task) for task in tasks]
 
-                # Creating the path for the altered image
-                img_name = path.join(modified_folder_path, f"{counter + 1}.{img_ext}") 
+        # Gather the decode timings of the workers
+        for _, timings in results:
+            decode_timings.merge(timings)
+        decode_timings.report()
 
-                # Writing the image
-                cv2.imwrite(img_name, img_array)
+        # Hand the order of the altered images over to video_writer
+        save_order(modified_folder_path, [name for name, _ in results if name is not None])
 
-            except Exception as error:
-                print(f"\n\n**** ERROR PROCESSING FILES '{file}': {error} ****\n\n")
+        # Keep the cache within its size cap
+        if cache is not None:
+            cache.evict()
 
         print("\n==== DONE altering images ====\n")
         # Returning path where altered images are stored
@@ -110,8 +172,397 @@ def image_modifier(downloading_path: str) -> str:
         print(f"\n\n**** ERROR IN image_modifier: {error} ****\n\n")
         return None
 
+def image_frames(downloading_path: str, workers: int = 1, chunksize: int = 8, 
+    spill: bool = False, cache: Optional[FrameCache] = None
+    ) -> Tuple[int, Generator[np.ndarray, None, None]]:
+    
+    """
+    Alters the images in a given directory and hands the frames over in memory, 
+    in the same order image_modifier would have numbered them.
+
+    Args:
+        downloading_path (str): The path to the directory containing the images 
+                                to be altered.
+        workers (int, optional): Number of processes altering the images. 
+                                 Defaults to 1 (no process pool).
+        chunksize (int, optional): Number of images handed to a process at once.
+                                   Defaults to 8.
+        spill (bool, optional): Also save the altered images to the directory 
+                                image_modifier uses. Defaults to False.
+        cache (FrameCache, optional): Cache of altered images, only the images 
+                                      which aren't in it are altered. Defaults 
+                                      to None (no cache).
+
+    Returns:
+        tuple: The total number of images and a generator yielding the altered 
+               images (None for the images which couldn't be altered).
+
+    Note:
+        Skips the write/read round-trip of the altered images through lossy JPEGs 
+        on disk. The images are altered in windows of a few chunks per worker so 
+        only a handful of frames wait in memory for the video writer.
+    """
+
+    # If the directory doesn't exist, exit the workflow
+    if not path.exists(downloading_path):
+        print(f"\n==== The directory {downloading_path} doesn't exist. ====")
+        print(f"==== Exiting workflow. ====\n")
+        exit()
+
+    # Directory for altered images, only when asked for
+    modified_folder_path = modified_folder(downloading_path) if spill else None
+
+    # Sorting filenames based on dates
+    sorted_filenames = sorted_images(downloading_path)
+
+    # Total number of files (used for desaturation)
+    total_files = len(sorted_filenames)
+
+    # Filenames of the spilled frames, in order
+    spilled_names = []
+
+    def frames() -> Generator[np.ndarray, None, None]:
+
+        print("\n==== Altering images ====\n")
+
+        # Paths and counters of the images, in the sorted order
+        fnames = [path.join(downloading_path, file) for file in sorted_filenames]
+        counters = range(1, total_files + 1)
+        totals = [total_files] * total_files
+        caches = [cache] * total_files
+
+        if workers > 1:
+            # Number of images altered ahead of the video writer
+            window = workers * chunksize * 2
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for start in range(0, total_files, window):
+                    stop = start + window
+                    yield from spilled(merged_timings(executor.map(buffered_alteration, 
+                        fnames[start:stop], counters[start:stop], totals[start:stop], 
+                        caches[start:stop], chunksize=chunksize)), start)
+        else:
+            yield from spilled(map(cached_alteration, fnames, counters, totals, 
+                caches), 0)
+
+        # Keep the cache within its size cap
+        if cache is not None:
+            cache.evict()
+
+        decode_timings.report()
+
+        # The spilled frames can be written to a video later on, in order
+        if modified_folder_path is not None:
+            save_order(modified_folder_path, spilled_names)
+
+        print("\n==== DONE altering images ====\n")
+
+    def spilled(altered: Generator[np.ndarray, None, None], 
+        start: int) -> Generator[np.ndarray, None, None]:
+
+        # Saves the frames to disk on their way to the video writer, if asked for
+        for counter, img_array in enumerate(altered, start + 1):
+            if modified_folder_path is not None and img_array is not None:
+                spilled_names.append(save_frame(img_array, sorted_filenames[counter - 1], 
+                    counter, modified_folder_path))
+            yield img_array
+
+    return total_files, frames()
+
+def modified_folder(downloading_path: str) -> str:
+    
+    """
+    Creates (if needed) the directory where the altered images are saved.
+
+    Args:
+        downloading_path (str): The path to the directory containing the images.
+
+    Returns:
+        str: The path to the directory for the altered images.
+    """
+
+    split_path = downloading_path.split("\\")
+    # Creating a new directory for altered images
+    root, folder = "\\".join(split_path[:-1]), split_path[-1]
+    modified_folder_path = path.join(root, f"modified_{folder}") 
+    
+    # If the directory doesn't exist, create it
+    if path.exists(modified_folder_path):
+        print(f"\n==== The directory {modified_folder_path} already exists. ====\n")
+    else:
+        mkdir(modified_folder_path)
+
+    return modified_folder_path
+
+def save_frame(img_array: np.ndarray, file: str, counter: int, 
+    modified_folder_path: str) -> str:
+    
+    """
+    Saves an altered image as {counter}.{ext} in the directory of altered images.
+
+    Args:
+        img_array (np.ndarray): The altered image.
+        file (str): The filename of the original image, used for the extension.
+        counter (int): The position of the image in the video.
+        modified_folder_path (str): The directory of altered images.
+
+    Returns:
+        str: The filename of the altered image.
+    """
+
+    # Extracting extension
+    img_ext = file.split('.')[-1]
+
+    # .heic isn't supported by OpenCV, so converting it to jpg
+    if img_ext == 'heic':
+        img_ext = "jpg"
+
+    # Creating the path for the altered image
+    img_name = path.join(modified_folder_path, f"{counter}.{img_ext}") 
+
+    # Writing the image
+    cv2.imwrite(img_name, img_array)
+
+    return path.basename(img_name)
+
+def alter_and_save(task: Tuple[str, str, int, int, str, Optional[FrameCache]]
+    ) -> Tuple[Optional[str], Dict[str, Tuple[int, float]]]:
+    
+    """
+    Alters a single image and saves it in the folder of modified images.
+
+    Args:
+        task (tuple): The directory of the image, the image filename, its counter 
+                      (position in the video), the total number of files, the 
+                      directory where the altered image is saved and the cache 
+                      of altered images (or None).
+
+    Returns:
+        tuple: The filename of the altered image (None if it couldn't be altered) 
+               and the decode timings of the process, drained for the parent.
+
+    Note:
+        Lives at module level so it can be sent to the processes of image_modifier.
+    """
+
+    downloading_path, file, counter, total_files, modified_folder_path, cache = task
+
+    try:
+        # Altering the image
+        img_array = cached_alteration(path.join(downloading_path, file), 
+            counter, total_files, cache, out=frame_buffer())
+
+        # Writing the image
+        img_name = save_frame(img_array, file, counter, modified_folder_path)
+
+    except Exception as error:
+        print(f"\n\n**** ERROR PROCESSING FILES '{file}': {error} ****\n\n")
+        img_name = None
+
+    return img_name, decode_timings.drain()
+
+def buffered_alteration(fname: str, counter: int, total_files: int, 
+    cache: Optional[FrameCache] = None
+    ) -> Tuple[np.ndarray, Dict[str, Tuple[int, float]]]:
+    
+    """
+    Alters an image like cached_alteration, into the frame buffer of the 
+    worker process.
+
+    Args:
+        fname, counter, total_files, cache: Same as cached_alteration.
+
+    Returns:
+        tuple: The altered image, in the frame buffer of the worker, and the 
+               decode timings of the process, drained for the parent.
+
+    Note:
+        Only meant for worker processes, whose results are pickled back to the 
+        parent before the buffer is used again.
+    """
+    img_array = cached_alteration(fname, counter, total_files, cache, out=frame_buffer())
+    return img_array, decode_timings.drain()
+
+def merged_timings(results: Iterable[Tuple[np.ndarray, Dict[str, Tuple[int, float]]]]
+    ) -> Generator[np.ndarray, None, None]:
+    
+    """
+    Yields the altered images from the results of buffered_alteration, merging 
+    the decode timings of the workers into the ones of this process.
+
+    Args:
+        results (iterable): Results of buffered_alteration.
+
+    Returns:
+        generator: The altered images.
+    """
+
+    for img_array, timings in results:
+        decode_timings.merge(timings)
+        yield img_array
+
+def cached_alteration(fname: str, counter: int, total_files: int, 
+    cache: Optional[FrameCache] = None, max_h: int = 1080, 
+    max_w: int = 1920, out: Optional[np.ndarray] = None) -> np.ndarray:
+    
+    """
+    Alters an image like image_alteration, going through the cache of altered 
+    images first.
+
+    Args:
+        fname (str): The path to the image file to be altered.
+        counter (int): The current file counter for desaturation calculation.
+        total_files (int): The total number of files for desaturation calculation.
+        cache (FrameCache, optional): Cache of altered images. Defaults to None 
+                                      (always alter the image).
+        max_h (int, optional): The maximum height for the resized image. Defaults to 1080.
+        max_w (int, optional): The maximum width for the resized image. Defaults to 1920.
+        out (np.ndarray, optional): Buffer the altered image is written to, see 
+                                    image_alteration. Defaults to None.
+
+    Returns:
+        np.ndarray: The altered image as a NumPy array.
+    """
+
+    if cache is None:
+        return image_alteration(fname, counter, total_files, max_h, max_w, out)
+
+    # Look the frame up in the cache, only the desaturation is left to do
+    key = cache.key(fname, (max_h, max_w))
+    frame = cache.get(key)
+
+    if frame is not None:
+        print(f"Cached file {fname}.")
+        return desaturate(frame, counter, total_files, out)
+
+    # Otherwise resize it and keep it for the next run, before desaturating it
+    frame = letterbox_image(fname, max_h, max_w, out)
+    if frame is None:
+        return None
+
+    cache.put(key, frame)
+
+    return desaturate(frame, counter, total_files)
+
+def frame_buffer(max_h: int = 1080, max_w: int = 1920) -> np.ndarray:
+    
+    """
+    Returns the frame buffer of the calling thread, allocated on first use.
+
+    Args:
+        max_h (int, optional): The height of the frame. Defaults to 1080.
+        max_w (int, optional): The width of the frame. Defaults to 1920.
+
+    Returns:
+        np.ndarray: A (max_h, max_w, 3) uint8 buffer, the same one on every call.
+
+    Note:
+        Only for images used up before the next one is altered in the same 
+        thread (saved to disk, or pickled back from a worker process).
+    """
+
+    buffer = getattr(frame_buffers, "frame", None)
+    if buffer is None or buffer.shape[:2] != (max_h, max_w):
+        buffer = frame_buffers.frame = np.empty((max_h, max_w, 3), np.uint8)
+
+    return buffer
+
+def reduction_factor(fname: str, max_h: int = 1080, max_w: int = 1920) -> int:
+    
+    """
+    Picks how much smaller a JPEG can be decoded while still covering the frame.
+
+    Args:
+        fname (str): The path to the image file.
+        max_h (int, optional): The maximum height for the resized image. Defaults to 1080.
+        max_w (int, optional): The maximum width for the resized image. Defaults to 1920.
+
+    Returns:
+        int: The reduction factor (8, 4, 2), 1 if the image has to be decoded 
+             at full size (not a JPEG, too small or unreadable header).
+
+    Note:
+        Only the header of the file is read, with PIL. OpenCV applies the EXIF 
+        orientation while decoding, so the dimensions are swapped for rotated images.
+    """
+
+    try:
+        with Image.open(fname) as header:
+            if header.format != "JPEG":
+                return 1
+
+            img_w, img_h = header.size
+            if header.getexif().get(0x0112, 1) in TRANSPOSED_ORIENTATIONS:
+                img_w, img_h = img_h, img_w
+
+    except Exception:
+        return 1
+
+    # Scaling factor the image will be resized with
+    scale = min(max_w / img_w, max_h / img_h)
+
+    # Largest reduction which still leaves at least the target size
+    for factor, _ in REDUCED_FLAGS:
+        if factor * scale <= 1:
+            return factor
+
+    return 1
+
+def decode_image(fname: str, max_h: int = 1080, max_w: int = 1920) -> Optional[np.ndarray]:
+    
+    """
+    Loads an image, decoding JPEGs straight at a reduced size when they are 
+    much bigger than the frame.
+
+    Args:
+        fname (str): The path to the image file.
+        max_h (int, optional): The maximum height for the resized image. Defaults to 1080.
+        max_w (int, optional): The maximum width for the resized image. Defaults to 1920.
+
+    Returns:
+        np.ndarray: The decoded image (BGR or grayscale), None if it couldn't be read.
+
+    Note:
+        A 12 MP photo decoded at 1/2 still covers a 1920x1080 frame, at a 
+        quarter of the decoding time and memory. The reduced decode happens 
+        inside libjpeg (DCT scaling), it isn't a resize after the fact. Every 
+        decode is timed in decode_timings.
+    """
+
+    # Time the decoding under the format of the image
+    fmt = fname.split(".")[-1].lower()
+    start = perf_counter()
+
+    # Iphone users please change your camera settings
+    # to most compatible, this is just unproductive
+    # Check if the file is a HEIC image
+    if fmt == "heic":
+        try:
+            # Use pillow-heif extension to open HEIC images, 10 bit (HDR) images 
+            # are brought down to 8 bit while decoding, 8 bit ones are left as is
+            img_t = open_heif(fname, convert_hdr_to_8bit=True, bgr_mode=True)
+            img = np.asarray(img_t)
+        except Exception as error:
+            print(f"\n\n****ERROR READING .HEIC FILE '{fname}': {error} ****\n\n")
+            return None
+    else:
+        try:
+            # Load the image from the file using OpenCV, reduced if worth it
+            factor = reduction_factor(fname, max_h, max_w)
+            flag = dict(REDUCED_FLAGS).get(factor, cv2.IMREAD_COLOR)
+            img = cv2.imread(fname, flag)
+        except Exception as error:
+            print(f"\n\n****ERROR READING IMAGE FILE '{fname}': {error} ****\n\n")
+            return None
+
+    if img is not None:
+        decode_timings.record(fmt, perf_counter() - start)
+
+    return img
+
 def image_alteration(fname: str, counter: int, total_files: int, 
-    max_h: int = 1080, max_w: int = 1920) -> np.ndarray:
+    max_h: int = 1080, max_w: int = 1920, 
+    out: Optional[np.ndarray] = None) -> np.ndarray:
     
     """
     Alters an image by resizing, padding, and desaturating it.
@@ -122,9 +573,64 @@ def image_alteration(fname: str, counter: int, total_files: int,
         total_files (int): The total number of files for desaturation calculation.
         max_h (int, optional): The maximum height for the resized image. Defaults to 1080.
         max_w (int, optional): The maximum width for the resized image. Defaults to 1920.
+        out (np.ndarray, optional): A (max_h, max_w, 3) uint8 buffer the altered 
+                                    image is written to, e.g. from frame_buffer. 
+                                    Defaults to None (a new array).
 
     Returns:
-        np.ndarray: The altered image as a NumPy array.
+        np.ndarray: The altered image as a NumPy array (out, if given).
+    """
+
+    final_img = letterbox_image(fname, max_h, max_w, out)
+    if final_img is None:
+        return None
+
+    return desaturate(final_img, counter, total_files)
+
+def desaturate(frame: np.ndarray, counter: int, total_files: int, 
+    out: Optional[np.ndarray] = None) -> np.ndarray:
+    
+    """
+    Desaturates a frame according to the position of its image in the video.
+
+    Args:
+        frame (np.ndarray): The frame, as returned by letterbox_image.
+        counter (int): The current file counter for desaturation calculation.
+        total_files (int): The total number of files for desaturation calculation.
+        out (np.ndarray, optional): Buffer the desaturated frame is written to. 
+                                    Defaults to None (frame, in place).
+
+    Returns:
+        np.ndarray: The desaturated frame (out, if given).
+    """
+
+    # Calculate the ratio of desaturation based on the number of images
+    ratio = counter / total_files  
+        
+    # Blend every pixel with its gray value in a single pass: 
+    # (1 - ratio) * pixel + ratio * gray, the black borders stay black
+    blend = ((1 - ratio) * np.eye(3, dtype=np.float32) + 
+        ratio * np.ones((3, 1), dtype=np.float32) @ GRAY_WEIGHTS)
+
+    return cv2.transform(frame, blend, dst=frame if out is None else out)
+
+def letterbox_image(fname: str, max_h: int = 1080, max_w: int = 1920, 
+    out: Optional[np.ndarray] = None) -> np.ndarray:
+    
+    """
+    Resizes and pads an image into a frame, before any desaturation. This is 
+    what the cache of altered images keeps, since it doesn't depend on the 
+    position of the image in the video.
+
+    Args:
+        fname, max_h, max_w, out: Same as image_alteration.
+
+    Returns:
+        np.ndarray: The frame as a NumPy array (out, if given).
+
+    Note:
+        The image is resized straight into its place in the frame, so the only 
+        full frame allocated is the returned one, and none at all with out.
     """
     
     try:
@@ -134,24 +640,8 @@ def image_alteration(fname: str, counter: int, total_files: int,
         # Initialize the final image
         final_img = None
 
-        # Iphone users please change your camera settings
-        # to most compatible, this is just unproductive
-        # Check if the file is a HEIC image
-        if fname.split(".")[-1] == "heic":
-            try:
-                # Use pillow-heif extension to open HEIC images
-                img_t = open_heif(fname, convert_hdr_to_8bit=False, bgr_mode=True)
-                img = np.asarray(img_t)
-            except Exception as error:
-                print(f"\n\n****ERROR READING .HEIC FILE '{fname}': {error} ****\n\n")
-                return final_img
-        else:
-            try:
-                # Load the image from the file using OpenCV
-                img = cv2.imread(fname)
-            except Exception as error:
-                print(f"\n\n****ERROR READING IMAGE FILE '{fname}': {error} ****\n\n")
-                return final_img
+        # Load the image, as small as it can be while still covering the frame
+        img = decode_image(fname, max_h, max_w)
 
         # Check if the image was loaded successfully
         if img is not None:
@@ -159,6 +649,10 @@ def image_alteration(fname: str, counter: int, total_files: int,
                 # Convert grayscale image to BGR
                 if len(img.shape) == 2:
                     img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+                # Drop the alpha channel, the frame has none
+                elif img.shape[2] == 4:
+                    img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
                     
                 # Get the actual image dimensions
                 img_h, img_w = img.shape[:2]
@@ -174,33 +668,25 @@ def image_alteration(fname: str, counter: int, total_files: int,
                 new_w = int(img_w * scale)
                 new_h = int(img_h * scale)
 
-                # Resize the image
-                resized_img = cv2.resize(img, (new_w, new_h))
-
                 # Calculate padding
                 top = (max_h - new_h) // 2
-                bottom = max_h - new_h - top
                 left = (max_w - new_w) // 2
-                right = max_w - new_w - left
 
-                # Add padding to the resized image
-                pad_img = cv2.copyMakeBorder(resized_img, top, bottom, left, 
-                    right, cv2.BORDER_CONSTANT)
+                # The frame, with the image centred in it and black borders
+                frame = out if out is not None else np.empty((max_h, max_w, 3), np.uint8)
+                view = frame[top:top + new_h, left:left + new_w]
+                frame[:top] = 0
+                frame[top + new_h:] = 0
+                frame[top:top + new_h, :left] = 0
+                frame[top:top + new_h, left + new_w:] = 0
 
-                # Calculate the ratio of desaturation based on the number of images
-                ratio = counter / total_files  
-                    
-                # Desaturate the image
-                d_img = cv2.cvtColor(pad_img, cv2.COLOR_BGR2GRAY)
-
-                # Merge desaturated image channels
-                cd_img = cv2.merge((d_img, d_img, d_img))
-                    
-                # Blend the original and desaturated image based on the ratio
-                final_img = cv2.addWeighted(pad_img, 1 - ratio, cd_img, ratio, 0)
+                # Resize the image straight into the frame, averaging the pixels 
+                # away when shrinking
+                interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+                cv2.resize(img, (new_w, new_h), dst=view, interpolation=interpolation)
 
-                # Delete temporary images to free up memory
-                del img, resized_img, d_img, cd_img
+                # Only a finished frame is handed back
+                final_img = frame
 
             except Exception as error:
                 print(f"\n\n**** ERROR PROCESSING IMAGE'{fname}': {error} ****\n\n")
@@ -211,5 +697,5 @@ def image_alteration(fname: str, counter: int, total_files: int,
         return final_img
     
     except Exception as error:
-        print(f"\n\n**** ERROR IN image_alterations: {error} ****\n\n")
+        print(f"\n\n**** ERROR IN letterbox_image: {error} ****\n\n")
         return None
\ No newline at end of file
@@ -3,35 +3,126 @@ from os import path
 from cowsay import get_output_string
 sys.path.append(path.abspath("google_drive"))
 from GoogleDriveClient import GoogleDriveClient, is_valid_name, take_arguements
+from GoogleDriveClient import FILE_FIELDS, EXIF_FIELDS
 from argparse import ArgumentParser
 sys.path.append(path.abspath("file_handling"))
 from FilesCreatedTime import get_actual_createdTime
-from FileDownloader import manage_files
+from FileDownloader import manage_files, sync_listing
+from ExifReader import fetch_capture_times
 sys.path.append(path.abspath("image_processing"))
-from ImageHandler import image_modifier
-sys.path.append(path.abspath("video_processing"))
-from VideoWriter import video_writer, video_enhancer
+from ImageHandler import image_modifier, image_frames
+from FrameCache import FrameCache
 sys.path.append(path.abspath("audio_processing"))
 from Audiofy import audiofy
+from BeatSync import detect_beats
+sys.path.append(path.abspath("video_processing"))
+from VideoWriter import video_writer, frames_writer, video_enhancer
+from SegmentedWriter import segmented_writer
+sys.path.append(path.abspath("pipeline"))
+from StreamPipeline import stream_pipeline
+from DistributedRender import coordinate, prepare_queue, work
 
 
 def main():
 	
 	args = take_arguements()
-	if is_valid_name(args.folder_name):
+	if args.role == "worker":
+		# Renders the segments of a coordinator, nothing to list or download
+		work(args.queue_path)
+	elif args.folder_name is None or args.duration_video_sec is None:
+		print("==== Missing Arguments. ====")
+		print("\nPlease give -f/--folder_name and -d/--duration_video_sec, only "
+			"--role worker runs without them.")
+	elif is_valid_name(args.folder_name):
 		print(get_output_string('cow', 'Starting the project'))
 		googledriveclient = GoogleDriveClient(args.token_filename, args.creds_filename)
 		folder_ids = googledriveclient.get_folder_id(args.folder_name)
-		files = googledriveclient.get_files_from_folder(folder_ids, args.extensions)
-		downloading_path = manage_files(args.folder_name, files, googledriveclient.creds)
-		modified_folder_path = image_modifier(downloading_path)
-		video_path = video_writer(modified_folder_path, args.duration_video_sec)
-		final_result_path = audiofy(video_path, args.duration_video_sec)
-		done_result_path = video_enhancer(final_result_path)
+		fields = EXIF_FIELDS if args.exif else FILE_FIELDS
+		if args.sync:
+			files, start_page_token = sync_listing(googledriveclient, folder_ids, 
+				args.extensions, args.folder_name, args.recursive, args.list_workers, 
+				fields)
+		elif args.recursive:
+			files = googledriveclient.walk_folder_tree(folder_ids, args.extensions, 
+				fields, workers=args.list_workers)
+			start_page_token = None
+		else:
+			files = googledriveclient.get_files_from_folder(folder_ids, args.extensions, 
+				fields)
+			start_page_token = None
+		if args.exif:
+			files = fetch_capture_times(list(files), googledriveclient.creds, 
+				args.download_workers)
+		# The ffmpeg encoder adds the audio itself
+		audio_file = path.join("resources\\audios", "audio.mp3")
+		if args.playlist:
+			audio_file = [path.join("resources\\audios", track) for track in args.playlist]
+		audio_path = None
+		if args.encoder == "ffmpeg":
+			audio_path = audio_file
+		beats = None
+		if args.beat_sync:
+			beats = detect_beats(audio_file, args.duration_video_sec)
+		encoding = dict(encoder=args.encoder, audio_path=audio_path, 
+			bitrate=args.bitrate, crf=args.crf, transition=args.transition, 
+			beats=beats)
+		cache = None
+		if args.frame_cache:
+			cache = FrameCache(max_bytes=int(args.cache_size_gb * 1024 ** 3))
+		if args.stream:
+			video_path = stream_pipeline(args.folder_name, files, googledriveclient.creds, 
+				args.duration_video_sec, queue_size=args.queue_size, 
+				download_workers=args.download_workers, 
+				max_download_workers=args.max_download_workers, 
+				heic_workers=args.heic_workers, 
+				chunk_size=args.download_chunk_mb * 1024 * 1024, **encoding)
+		elif args.role == "coordinator":
+			prepare_queue(args.queue_path)
+			downloading_path = manage_files(args.folder_name, files, 
+				googledriveclient.creds, args.download_workers, args.max_download_workers, 
+				sync=args.sync, start_page_token=start_page_token, 
+				chunk_size=args.download_chunk_mb * 1024 * 1024)
+			video_path = coordinate(downloading_path, args.duration_video_sec, 
+				args.queue_path, args.segments or 0, args.local_workers, cache=cache, 
+				**encoding)
+		elif args.segments is not None:
+			downloading_path = manage_files(args.folder_name, files, 
+				googledriveclient.creds, args.download_workers, args.max_download_workers, 
+				sync=args.sync, start_page_token=start_page_token, 
+				chunk_size=args.download_chunk_mb * 1024 * 1024)
+			video_path = segmented_writer(downloading_path, args.duration_video_sec, 
+				args.segments, cache=cache, **encoding)
+		elif args.in_memory:
+			downloading_path = manage_files(args.folder_name, files, 
+				googledriveclient.creds, args.download_workers, args.max_download_workers, 
+				sync=args.sync, start_page_token=start_page_token, 
+				chunk_size=args.download_chunk_mb * 1024 * 1024)
+			total_files, frames = image_frames(downloading_path, args.workers, 
+				args.chunksize, args.spill, cache)
+			video_path = frames_writer(frames, total_files, args.duration_video_sec, 
+				**encoding)
+		else:
+			downloading_path = manage_files(args.folder_name, files, 
+				googledriveclient.creds, args.download_workers, args.max_download_workers, 
+				sync=args.sync, start_page_token=start_page_token, 
+				chunk_size=args.download_chunk_mb * 1024 * 1024)
+			modified_folder_path = image_modifier(downloading_path, args.workers, 
+				args.chunksize, cache)
+			video_path = video_writer(modified_folder_path, args.duration_video_sec, 
+				**encoding)
+		if args.encoder == "ffmpeg":
+			# Already has its audio, padding and bitrate
+			done_result_path = video_path
+		else:
+			final_result_path = audiofy(video_path, args.duration_video_sec, 
+				args.playlist or "audio.mp3")
+			done_result_path = video_enhancer(final_result_path)
 		print(get_output_string('cow', 'Ending the project'))
 	else:
 		print("==== Invalid Folder Name. ====")
 		print("\nPlease ensure the Folder Name follows these rules:")
 		print(is_valid_name.__doc__)
 
-main()
\ No newline at end of file
+# Guard is needed since image_modifier spawns processes which import this module
+if __name__ == "__main__":
+	main()
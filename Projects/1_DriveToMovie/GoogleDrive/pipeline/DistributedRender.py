@@ -0,0 +1,297 @@
+"""
+Distributed version of the segmented render (--role coordinator / worker).
+
+The largest albums take longer than a night to render on one machine, even
+with every core busy (see SegmentedWriter.py). The segments are spread over
+several machines instead, through a JobQueue on storage they all share:
+
+    coordinator:  download, split into segment jobs --> queue
+    workers:      claim a job, alter and encode its segment (render_segment),
+                  beating its heartbeat, report the segment file back --> queue
+    coordinator:  wait for every job, join the segments
+
+A job whose heartbeat stops (the worker died) goes to another worker. Every
+worker renders into a file of its own, moved to the segment file when it
+reports the job done, so a worker taken for dead which is still rendering never
+writes over the segment of the worker which took its job over.
+
+The resources folder (downloaded images, segments) has to be on the shared
+storage too, and every process runs from the project folder, so the relative
+paths in the jobs point to the same files on every node. The coordinator can
+also start worker processes on its own node (local_workers), which is how the
+whole thing runs (and is tried out) on a single machine.
+"""
+
+import re
+import socket
+from os import path, getpid, remove
+from time import sleep
+from threading import Thread, Event
+from multiprocessing import Process
+from typing import List, Dict, Tuple, Optional, Union
+from FrameCache import FrameCache
+from ImageHandler import decode_timings
+from SegmentedWriter import segment_tasks, render_segment, join_segments
+from JobQueue import JobQueue
+
+
+def job_payload(task: Tuple) -> Dict:
+
+    """
+    Turns a task of render_segment into a job of the queue.
+
+    Args:
+        task (tuple): The task, as returned by segment_tasks.
+
+    Returns:
+        dict: The job, which can be stored as JSON.
+    """
+
+    *args, cache = task
+    return {"task": args,
+        "cache": None if cache is None else [cache.cache_dir, cache.max_bytes]}
+
+
+def payload_task(payload: Dict) -> Tuple:
+
+    """
+    Turns a job of the queue back into a task of render_segment.
+
+    Args:
+        payload (dict): The job, as returned by job_payload.
+
+    Returns:
+        tuple: The task.
+    """
+
+    cache = FrameCache(*payload["cache"]) if payload["cache"] else None
+    return tuple(payload["task"]) + (cache,)
+
+
+def prepare_queue(queue_path: str) -> None:
+
+    """
+    Empties the queue and opens it, so workers started while the coordinator
+    is still downloading wait for the jobs instead of finding the queue of the
+    previous render closed.
+
+    Args:
+        queue_path (str): The path to the queue, on shared storage.
+
+    Returns:
+        None
+    """
+
+    JobQueue(queue_path).reset([])
+
+
+def heartbeat(queue_path: str, job_id: int, worker: str, interval: float,
+    stop: Event) -> None:
+
+    """
+    Beats the heartbeat of a job until stop is set. Runs in a thread of the
+    worker, with a connection of its own.
+
+    Args:
+        queue_path (str): The path to the queue.
+        job_id (int): The id of the job.
+        worker (str): Name of the worker running it.
+        interval (float): Seconds between two beats.
+        stop (Event): Set once the job is over.
+
+    Returns:
+        None
+    """
+
+    queue = JobQueue(queue_path)
+    try:
+        while not stop.wait(interval):
+            if not queue.beat(job_id, worker):
+                print(f"\n==== Segment {job_id} was handed to another worker ====\n")
+                break
+    finally:
+        queue.connection.close()
+
+
+def work(queue_path: str, poll: float = 2.0, interval: float = 10.0) -> int:
+
+    """
+    Runs segment jobs from the queue until the coordinator closes it.
+
+    Args:
+        queue_path (str): The path to the queue, on shared storage.
+        poll (float, optional): Seconds to wait when no job is pending.
+                                Defaults to 2.
+        interval (float, optional): Seconds between two heartbeats of the job
+                                    being rendered. Defaults to 10.
+
+    Returns:
+        int: Number of jobs done by this worker.
+    """
+
+    worker = f"{socket.gethostname()}:{getpid()}"
+    queue = JobQueue(queue_path)
+    done = 0
+
+    # Tells the files of this worker apart from those of the others
+    tag = re.sub(r"\W", "_", worker)
+
+    print(f"\n==== Worker {worker} waiting for jobs in {queue_path} ====\n")
+
+    while True:
+        job = queue.claim(worker)
+
+        if job is None:
+            if queue.closed():
+                break
+            sleep(poll)
+            continue
+
+        job_id, payload = job
+        task = payload_task(payload)
+
+        # Rendered under a name of its own, moved to the segment file by complete
+        segment_file = task[5]
+        stem, ext = path.splitext(segment_file)
+        rendered_file = f"{stem}.{tag}{ext}"
+
+        stop = Event()
+        beats = Thread(target=heartbeat, args=(queue_path, job_id, worker, interval,
+            stop), daemon=True)
+        beats.start()
+
+        try:
+            _, timings = render_segment(task[:5] + (rendered_file,) + task[6:])
+            stop.set()
+            beats.join()
+            if queue.complete(job_id, worker, {"segment_file": segment_file,
+                "timings": timings}, rename=(rendered_file, segment_file)):
+                done += 1
+
+        # The coordinator decides what to do with a failed segment
+        except Exception as error:
+            print(f"\n\n**** ERROR IN SEGMENT {job_id}: {error} ****\n\n")
+            stop.set()
+            beats.join()
+            queue.fail(job_id, worker, repr(error))
+            if path.exists(rendered_file):
+                remove(rendered_file)
+
+    print(f"\n==== Worker {worker} done, {done} segment(s) rendered ====\n")
+
+    return done
+
+
+def local_workers(queue_path: str, count: int) -> List[Process]:
+
+    """
+    Starts worker processes on this node.
+
+    Args:
+        queue_path (str): The path to the queue.
+        count (int): Number of worker processes.
+
+    Returns:
+        list: The started processes.
+    """
+
+    processes = [Process(target=work, args=(queue_path,)) for _ in range(count)]
+    for process in processes:
+        process.start()
+
+    return processes
+
+
+def coordinate(downloading_path: str, duration: int, queue_path: str,
+    segments: int = 0, workers: int = 0, vid_name: str="video.mp4",
+    max_h: int=1080, max_w: int=1920, codec: str='mp4v', encoder: str="opencv",
+    audio_path: Union[str, List[str], None]=None, bitrate: str="15000k",
+    crf: Optional[int]=None, transition: str="cut",
+    beats: Optional[List[float]]=None, cache: Optional[FrameCache]=None,
+    poll: float = 2.0, stale_after: float = 120) -> Optional[str]:
+
+    """
+    Splits the video into segment jobs for the workers, waits for them and
+    joins the segments.
+
+    Args:
+        downloading_path (str): The path to the directory containing the images.
+        duration (int): Duration of the video in seconds.
+        queue_path (str): The path to the queue, on shared storage.
+        segments (int, optional): Number of segments. Defaults to 0 (one per
+                                  core of this node).
+        workers (int, optional): Number of workers started on this node.
+                                 Defaults to 0 (workers run elsewhere).
+        vid_name, max_h, max_w, codec, encoder, audio_path, bitrate, crf,
+        transition, beats, cache: See SegmentedWriter.segmented_writer.
+        poll (float, optional): Seconds between two looks at the queue.
+                                Defaults to 2.
+        stale_after (float, optional): Seconds without a heartbeat after which
+                                       a running job is handed to another
+                                       worker. Defaults to 120.
+
+    Returns:
+        str: Path where the video is saved, None if there are no images.
+
+    Raises:
+        RuntimeError: If a segment failed.
+    """
+
+    print("\n==== Coordinating the render ====\n")
+
+    tasks = segment_tasks(downloading_path, duration, segments, vid_name, max_h,
+        max_w, codec, encoder, bitrate, crf, transition, beats, cache)
+
+    queue = JobQueue(queue_path)
+
+    # Nothing to render, only let the workers stop
+    if not tasks:
+        queue.close()
+        return None
+
+    queue.reset([job_payload(task) for task in tasks])
+
+    processes = local_workers(queue_path, workers)
+
+    try:
+        last_counts = None
+        while True:
+            # Progress, whenever it changes
+            counts = queue.counts()
+            if counts != last_counts:
+                print(f"==== Segments: {counts.get('done', 0)}/{len(tasks)} done, "
+                      f"{counts.get('running', 0)} running, "
+                      f"{counts.get('failed', 0)} failed ====")
+                last_counts = counts
+
+            if counts.get("failed"):
+                raise RuntimeError(f"Segment(s) failed: {queue.errors()}")
+            if counts.get("done", 0) == len(tasks):
+                break
+
+            # Workers which died stop beating the heartbeat of their job
+            requeued = queue.requeue_stale(stale_after)
+            if requeued:
+                print(f"\n==== Handed {requeued} stale segment(s) to other workers ====\n")
+
+            sleep(poll)
+
+    finally:
+        # Let the workers stop, whatever happened, without starting the 
+        # segments still pending
+        queue.close()
+        for process in processes:
+            process.join()
+
+    segment_files = []
+    for result in queue.results():
+        decode_timings.merge(result["timings"])
+        segment_files.append(result["segment_file"])
+
+    # Keep the cache within its size cap
+    if cache is not None:
+        cache.evict()
+
+    decode_timings.report()
+
+    return join_segments(segment_files, duration, vid_name, encoder, audio_path)
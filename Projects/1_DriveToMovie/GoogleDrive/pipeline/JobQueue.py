@@ -0,0 +1,318 @@
+"""
+Job queue of a distributed render, in a SQLite file on shared storage.
+
+The coordinator puts one job per segment of the video in the queue, and the
+workers (on any node which sees the shared storage) claim them one at a time:
+
+    pending --claim--> running --complete--> done
+                          |------fail------> failed
+                          |--requeue_stale--> pending   (no heartbeat)
+    pending --close--> cancelled                            (coordinator stopped)
+
+A claim is a single write transaction (BEGIN IMMEDIATE), so two workers never
+get the same job, whichever nodes they run on. A worker keeps beating its
+job's heartbeat while it runs it, and only jobs whose heartbeat stopped (the
+worker is gone) are handed to another worker, however long they take. Jobs and
+results are stored as JSON, so the queue can be looked at with any SQLite
+client while it runs.
+
+The heartbeats are written with the clock of the workers' nodes and read with
+the coordinator's, so the clocks of the nodes have to agree (NTP) within the
+time after which a job is stale.
+"""
+
+import json
+import sqlite3
+from os import path, remove, replace
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+
+class JobQueue:
+
+    """
+    A queue of render jobs shared by a coordinator and its workers.
+
+    Attributes:
+    - queue_path (str): The path to the SQLite file.
+    - connection (sqlite3.Connection): The connection to the queue.
+    """
+
+    def __init__(self, queue_path: str, timeout: float = 60) -> None:
+
+        """
+        Initializes JobQueue, creating the tables if needed.
+
+        Args:
+        - queue_path (str): The path to the SQLite file, on storage every node
+                            sees.
+        - timeout (float, optional): Seconds to wait for the other processes to
+                                     release the queue. Defaults to 60.
+        """
+
+        self.queue_path = queue_path
+
+        # Transactions are started explicitly
+        self.connection = sqlite3.connect(queue_path, timeout=timeout,
+            isolation_level=None)
+
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                claimed_at REAL,
+                heartbeat REAL,
+                result TEXT,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS status (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+    def reset(self, payloads: List[Dict]) -> None:
+
+        """
+        Replaces the jobs of the queue with new ones, and opens it.
+
+        Args:
+        - payloads (list): The jobs, in order.
+
+        Returns:
+        - None
+        """
+
+        with self.transaction():
+            self.connection.execute("DELETE FROM jobs")
+            self.connection.execute("DELETE FROM status")
+            self.connection.executemany("INSERT INTO jobs (id, payload) VALUES (?, ?)",
+                [(index, json.dumps(payload)) for index, payload in enumerate(payloads)])
+
+    def claim(self, worker: str) -> Optional[Tuple[int, Dict]]:
+
+        """
+        Claims the next pending job.
+
+        Args:
+        - worker (str): Name of the claiming worker.
+
+        Returns:
+        - tuple: The id and payload of the job, None if no job is pending.
+        """
+
+        with self.transaction():
+            row = self.connection.execute(
+                "SELECT id, payload FROM jobs WHERE state = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            now = time()
+            self.connection.execute("UPDATE jobs SET state = 'running', worker = ?, "
+                "claimed_at = ?, heartbeat = ? WHERE id = ?", (worker, now, now, row[0]))
+
+        return row[0], json.loads(row[1])
+
+    def beat(self, job_id: int, worker: str) -> bool:
+
+        """
+        Tells the coordinator the worker is still running a job.
+
+        Args:
+        - job_id (int): The id of the job.
+        - worker (str): Name of the worker running it.
+
+        Returns:
+        - bool: False if the job was handed to another worker in the meantime.
+        """
+
+        with self.transaction():
+            cursor = self.connection.execute("UPDATE jobs SET heartbeat = ? "
+                "WHERE id = ? AND worker = ? AND state = 'running'",
+                (time(), job_id, worker))
+
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: int, worker: str, result: Dict,
+        rename: Optional[Tuple[str, str]] = None) -> bool:
+
+        """
+        Reports a job as done.
+
+        Args:
+        - job_id (int): The id of the job.
+        - worker (str): Name of the worker which ran it.
+        - result (dict): The result of the job.
+        - rename (tuple, optional): (temporary file, final file), the output the
+                                    worker wrote under a name of its own, moved
+                                    to its final name along with the report.
+                                    Defaults to None.
+
+        Returns:
+        - bool: False if the job was handed to another worker in the meantime,
+                its output is then thrown away.
+        """
+
+        # A job handed to another worker in the meantime belongs to it, the
+        # output is only moved while the job is locked as this worker's
+        with self.transaction():
+            owned = self.connection.execute("SELECT 1 FROM jobs WHERE id = ? "
+                "AND worker = ? AND state = 'running'", (job_id, worker)).fetchone()
+
+            if owned:
+                if rename is not None:
+                    replace(*rename)
+                self.connection.execute("UPDATE jobs SET state = 'done', result = ? "
+                    "WHERE id = ?", (json.dumps(result), job_id))
+
+        if not owned and rename is not None and path.exists(rename[0]):
+            remove(rename[0])
+
+        return owned is not None
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+
+        """
+        Reports a job as failed.
+
+        Args:
+        - job_id (int): The id of the job.
+        - worker (str): Name of the worker which ran it.
+        - error (str): What went wrong.
+
+        Returns:
+        - None
+        """
+
+        with self.transaction():
+            self.connection.execute("UPDATE jobs SET state = 'failed', error = ? "
+                "WHERE id = ? AND worker = ? AND state = 'running'",
+                (error, job_id, worker))
+
+    def requeue_stale(self, stale_after: float) -> int:
+
+        """
+        Puts back the running jobs whose heartbeat stopped, their worker is
+        taken as gone.
+
+        Args:
+        - stale_after (float): Seconds without a heartbeat after which a running
+                               job is stale.
+
+        Returns:
+        - int: Number of jobs put back.
+        """
+
+        with self.transaction():
+            cursor = self.connection.execute("UPDATE jobs SET state = 'pending', "
+                "worker = NULL, claimed_at = NULL, heartbeat = NULL "
+                "WHERE state = 'running' AND heartbeat < ?", (time() - stale_after,))
+
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+
+        """
+        Returns the number of jobs in every state.
+
+        Returns:
+        - dict: Number of jobs, per state.
+        """
+
+        return dict(self.connection.execute(
+            "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def results(self) -> List[Dict]:
+
+        """
+        Returns the results of the done jobs, in order.
+
+        Returns:
+        - list: The results of the jobs.
+        """
+
+        return [json.loads(row[0]) for row in self.connection.execute(
+            "SELECT result FROM jobs WHERE state = 'done' ORDER BY id")]
+
+    def errors(self) -> List[Tuple[int, str, str]]:
+
+        """
+        Returns the failed jobs.
+
+        Returns:
+        - list: (id, worker, error) of every failed job.
+        """
+
+        return self.connection.execute(
+            "SELECT id, worker, error FROM jobs WHERE state = 'failed' ORDER BY id"
+        ).fetchall()
+
+    def close(self) -> None:
+
+        """
+        Tells the workers there's nothing more to come, so they can stop. Jobs
+        still pending (the coordinator stopped on a failed one) are cancelled,
+        so no worker starts them.
+
+        Returns:
+        - None
+        """
+
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE jobs SET state = 'cancelled' WHERE state = 'pending'")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO status (key, value) VALUES ('closed', '1')")
+
+    def closed(self) -> bool:
+
+        """
+        Returns whether the coordinator closed the queue.
+
+        Returns:
+        - bool: True once the queue is closed.
+        """
+
+        return self.connection.execute(
+            "SELECT 1 FROM status WHERE key = 'closed'").fetchone() is not None
+
+    def transaction(self) -> "Transaction":
+
+        """
+        Returns a write transaction on the queue, for a with statement.
+
+        Returns:
+        - Transaction: The transaction.
+        """
+
+        return Transaction(self.connection)
+
+
+class Transaction:
+
+    """
+    A write transaction, taken right away (BEGIN IMMEDIATE) so two processes
+    never read the same pending job before either writes.
+
+    Attributes:
+    - connection (sqlite3.Connection): The connection to the queue.
+    """
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+
+        """
+        Initializes Transaction.
+        """
+
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
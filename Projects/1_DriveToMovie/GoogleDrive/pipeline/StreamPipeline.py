@@ -0,0 +1,216 @@
+"""
+Streaming version of the DriveToMovie workflow.
+
+The regular workflow runs every stage to completion before the next one starts
+(download everything -> alter everything -> encode everything). For big folders
+that means waiting on the network, then on the CPU, then on the encoder, while
+keeping every original and every altered image on disk.
+
+Here the three stages run at the same time and are connected by bounded queues:
+
+    download workers --> alteration workers --> video writer
+
+The order of the images is decided up front from the Drive metadata, so the
+video writer only has to put the frames back in order as they arrive. At most
+`queue_size` images are in flight (downloaded but not yet written) at any time,
+which keeps disk and memory usage bounded no matter how big the folder is.
+
+HEIC images take several times longer to decode than JPEGs, so the alteration
+threads hand them to a separate pool of processes and only alter the other
+images themselves.
+"""
+
+from os import path, makedirs, remove
+from queue import Queue
+from threading import Thread, BoundedSemaphore
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Dict, Optional, Union
+from google.auth.credentials import Credentials
+from GoogleDriveClient import ServicePool
+from FilesCreatedTime import resolve_created_times
+from FileDownloader import pooled_download, DOWNLOAD_CHUNK_SIZE
+from DownloadScheduler import DownloadScheduler
+from ImageHandler import image_alteration, buffered_alteration, decode_timings
+from VideoWriter import create_video_writer
+
+
+def stream_pipeline(folder_name: str, files: List[Dict], creds: Credentials,
+    duration: int, vid_name: str = "video.mp4", queue_size: int = 16,
+    download_workers: int = 4, max_download_workers: int = 16, 
+    alter_workers: int = 2, heic_workers: int = 2, keep_downloads: bool = False, 
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE, encoder: str = "opencv", 
+    audio_path: Union[str, List[str], None] = None, bitrate: str = "15000k", 
+    crf: Optional[int] = None, transition: str = "cut", 
+    beats: Optional[List[float]] = None) -> Optional[str]:
+
+    """
+    Downloads, alters and writes the images to the video in a single streaming pass.
+
+    Args:
+        folder_name (str): The name of the folder where files will be downloaded.
+        files (list): A list of dictionaries containing the metadata of the files
+                      to be downloaded, as returned by get_files_from_folder.
+        creds (google.auth.credentials.Credentials): The Google Drive API credentials.
+        duration (int): Duration (in seconds) of the video, used to calculate fps.
+        vid_name (str, optional): Name of the output video file. Defaults to "video.mp4".
+        queue_size (int, optional): Maximum number of images in flight between
+                                    the stages. Defaults to 16.
+        download_workers (int, optional): Number of concurrent downloads to start 
+                                          with. Defaults to 4.
+        max_download_workers (int, optional): Most concurrent downloads the 
+                                              scheduler may ramp up to. Defaults to 16.
+        alter_workers (int, optional): Number of alteration threads. Defaults to 2.
+        heic_workers (int, optional): Number of processes altering the HEIC 
+                                      images. Defaults to 2.
+        keep_downloads (bool, optional): Keep the downloaded originals on disk
+                                         once they are written. Defaults to False.
+        chunk_size (int, optional): Number of bytes requested at once while 
+                                    downloading a file. Defaults to 8 MB.
+        encoder, audio_path, bitrate, crf, transition, beats: See 
+        VideoWriter.create_video_writer.
+
+    Returns:
+        str: Path where the video is saved, None if something went wrong.
+    """
+    print("\n==== Streaming images to the video ====\n")
+
+    # Create the download folder if it doesn't exist
+    rsrc_path = "resources\\downloaded_folder"
+    downloading_path = path.join(rsrc_path, folder_name)
+    if not path.exists(downloading_path):
+        makedirs(downloading_path)
+
+    # Decide the order of the video before downloading anything, ties are
+    # broken by file id so the order is the same on every run
+    files = list(files)
+    ordered = sorted(zip(resolve_created_times(files), files),
+        key=lambda item: (item[0], item[1]["id"]))
+
+    # Total number of files (used for fps and desaturation)
+    total_files = len(ordered)
+
+    # Bounds the images downloaded but not yet written to the video
+    slots = BoundedSemaphore(queue_size)
+
+    # Queues connecting the stages
+    downloaded = Queue(maxsize=queue_size)
+    altered = Queue(maxsize=queue_size)
+
+    # Google Drive Services shared by the download threads
+    services = ServicePool(creds)
+
+    # One alteration thread per HEIC process on top of the others, so HEIC 
+    # images waiting on the pool don't hold up the rest
+    alter_threads = alter_workers + heic_workers
+
+    def handoff(index: int, file: Dict, future: Future) -> None:
+
+        # Hands a finished download to the alteration stage
+        if future.exception() is not None:
+            print(f"\n\n**** ERROR DOWNLOADING FILE '{file['name']}': {future.exception()} ****\n\n")
+            downloaded.put((index, None))
+        else:
+            downloaded.put((index, future.result()))
+
+    def download_stage() -> None:
+
+        # Submits the downloads in video order, never more than queue_size ahead
+        with DownloadScheduler(download_workers, max_download_workers) as scheduler:
+            for index, (fname, file) in enumerate(ordered):
+                slots.acquire()
+                future = scheduler.submit(pooled_download, services, file["id"], fname,
+                    file["mimeType"].split("/")[1], downloading_path, file["modifiedTime"], 
+                    chunk_size)
+                future.add_done_callback(
+                    lambda future, index=index, file=file: handoff(index, file, future))
+
+        # Tell the alteration workers that nothing else is coming
+        for _ in range(alter_threads):
+            downloaded.put(None)
+
+    def alter_stage() -> None:
+
+        # Alters the downloaded images and hands them to the video writer
+        while (item := downloaded.get()) is not None:
+            index, file_path = item
+            frame = None
+
+            if file_path is not None:
+                # The writer waits for every index, so a failed image is 
+                # handed over without a frame instead of stopping the thread
+                try:
+                    if file_path.endswith(".heic"):
+                        # Slow to decode, done by the pool of HEIC processes
+                        frame, timings = heic_pool.submit(buffered_alteration, file_path, 
+                            index + 1, total_files).result()
+                        decode_timings.merge(timings)
+                    else:
+                        frame = image_alteration(file_path, index + 1, total_files)
+
+                except Exception as error:
+                    print(f"\n\n**** ERROR ALTERING IMAGE '{file_path}': {error} ****\n\n")
+                    frame = None
+
+                # The original isn't needed anymore once it's altered
+                if not keep_downloads:
+                    try:
+                        remove(file_path)
+                    except OSError as error:
+                        print(f"\n\n**** ERROR REMOVING IMAGE '{file_path}': {error} ****\n\n")
+
+            altered.put((index, frame))
+
+    try:
+        # Create a VideoWriter object
+        video_writer, video_path = create_video_writer(total_files, duration, vid_name, 
+            encoder=encoder, audio_path=audio_path, bitrate=bitrate, crf=crf, 
+            transition=transition, beats=beats)
+
+        # Processes decoding and altering the HEIC images
+        heic_pool = ProcessPoolExecutor(max_workers=heic_workers)
+
+        # Start the download and alteration stages
+        stages = [Thread(target=download_stage, daemon=True)]
+        stages += [Thread(target=alter_stage, daemon=True) for _ in range(alter_threads)]
+        for stage in stages:
+            stage.start()
+
+        # Frames which arrived before their turn
+        pending = {}
+        next_index = 0
+
+        # Write the frames in order as they arrive
+        while next_index < total_files:
+            index, frame = altered.get()
+            pending[index] = frame
+
+            while next_index in pending:
+                frame = pending.pop(next_index)
+
+                if frame is None:
+                    print(f"\n\n**** WARNING: NO FRAME FOR IMAGE {next_index + 1}. Skipping. ****\n\n")
+                    video_writer.hold()
+                else:
+                    print(f"Writing image {next_index + 1}/{total_files} to the video.")
+                    video_writer.write(frame)
+
+                # Let another image in
+                slots.release()
+                next_index += 1
+
+        # Wait for the stages to wind down
+        for stage in stages:
+            stage.join()
+        heic_pool.shutdown()
+        decode_timings.report()
+
+        # Release the VideoWriter object
+        video_writer.release()
+
+        print("\n==== DONE streaming images to the video ====\n")
+        # Return the path where the video is saved
+        return video_path
+
+    except Exception as error:
+        print(f"\n\n**** ERROR IN stream_pipeline: {error} ****\n\n")
+        return None
@@ -0,0 +1,275 @@
+"""
+Segmented rendering of long slideshows (--segments).
+
+A single writer encodes the whole slideshow on one core, however many cores
+alter the images. The images are split instead into contiguous segments, every
+segment is altered and encoded by its own process into its own file, and the
+files are joined with ffmpeg's concat demuxer, which copies the encoded frames
+as they are (no re-encode):
+
+    resources\\videos\\segments\\video_0000.mp4   images [0, n/S)
+    resources\\videos\\segments\\video_0001.mp4   images [n/S, 2n/S)
+    ...
+    resources\\videos\\video.mp4                  concatenated
+
+Every segment is the same video the single writer would have written over its
+images: the images keep their counters in the whole video (so the desaturation
+is the same), the frames they're shown for come from the cuts of the whole
+video (see Timeline.timeline_cuts), and the last image of a segment is handed
+the first image of the next one to fade into. All segments are encoded with the
+same settings, so they can be joined without re-encoding. With the ffmpeg
+encoder the audio is muxed into the joined video afterwards, copying the video.
+"""
+
+import subprocess
+from os import path, makedirs, remove, cpu_count
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Optional, Union
+from ImageHandler import sorted_images, cached_alteration, decode_timings
+from FrameCache import FrameCache
+from Timeline import Timeline, timeline_fps, timeline_cuts
+from Transitions import Transitions
+from VideoWriter import open_writer
+from Audiofy import mux_command
+
+
+def segment_bounds(total_images: int, segments: int) -> List[Tuple[int, int]]:
+
+    """
+    Splits the images of the video into contiguous segments of (nearly) the
+    same number of images.
+
+    Args:
+        total_images (int): Number of images in the video.
+        segments (int): Number of segments.
+
+    Returns:
+        list: (start, stop) of every non-empty segment, the images [start, stop).
+    """
+
+    bounds = [index * total_images // segments for index in range(segments + 1)]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def render_segment(task: Tuple) -> Tuple[str, Dict[str, Tuple[int, float]]]:
+
+    """
+    Alters the images of a segment and encodes them into the segment file.
+    Runs inside the processes of segmented_writer.
+
+    Args:
+        task (tuple): The image paths of the segment followed by the first
+                      image of the next segment (if any), the counter of the
+                      first image, the total number of images, the cuts of the
+                      segment, the fps, the segment file, and the max_h, max_w,
+                      codec, encoder, bitrate, crf, transition and cache of
+                      segmented_writer.
+
+    Returns:
+        tuple: The segment file and the decode timings of the process, drained
+               for the parent.
+    """
+
+    (fnames, first_counter, total_files, cuts, fps, segment_file, max_h, max_w,
+        codec, encoder, bitrate, crf, transition, cache) = task
+
+    # The images of the segment, the image after them isn't written
+    count = len(cuts) - 1
+
+    # The audio goes on the joined video
+    writer = open_writer(segment_file, fps, max_h, max_w, codec, encoder, None, None,
+        bitrate, crf)
+    timeline = Timeline(writer, count, cuts[-1] / fps, fps,
+        Transitions(transition, fps), cuts)
+
+    for counter, fname in enumerate(fnames[:count], first_counter):
+        img_array = cached_alteration(fname, counter, total_files, cache, max_h, max_w)
+        if img_array is None:
+            timeline.hold()
+        else:
+            timeline.write(img_array)
+
+    # The last image fades into the first image of the next segment
+    next_frame = None
+    if len(fnames) > count and timeline.transitions.fade_frames:
+        next_frame = cached_alteration(fnames[count], first_counter + count,
+            total_files, cache, max_h, max_w)
+
+    timeline.release(next_frame)
+    print(f"\n==== Wrote images {first_counter} to {first_counter + count - 1} "
+          f"to {segment_file} ====\n")
+
+    return segment_file, decode_timings.drain()
+
+
+def concat_segments(segment_files: List[str], output_file: str) -> None:
+
+    """
+    Joins the segments with ffmpeg's concat demuxer, copying the streams.
+
+    Args:
+        segment_files (list): The paths to the segments, in order.
+        output_file (str): The path to the joined video.
+
+    Returns:
+        None
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg failed.
+    """
+
+    # The paths in the list are relative to it, so absolute ones are given,
+    # quoted so the backslashes are taken as they are
+    list_file = f"{output_file}.segments.txt"
+    with open(list_file, "w") as f:
+        for segment_file in segment_files:
+            quoted = path.abspath(segment_file).replace("'", "'\\''")
+            f.write(f"file '{quoted}'\n")
+
+    try:
+        subprocess.run(["ffmpeg", "-y", "-nostats", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", output_file],
+            check=True)
+    finally:
+        remove(list_file)
+
+
+def segment_tasks(downloading_path: str, duration: int, segments: int = 0,
+    vid_name: str="video.mp4", max_h: int=1080, max_w: int=1920,
+    codec: str='mp4v', encoder: str="opencv", bitrate: str="15000k",
+    crf: Optional[int]=None, transition: str="cut",
+    beats: Optional[List[float]]=None, cache: Optional[FrameCache]=None
+    ) -> List[Tuple]:
+
+    """
+    Splits the video into the tasks of render_segment.
+
+    Args:
+        downloading_path, duration, segments, vid_name, max_h, max_w, codec,
+        encoder, bitrate, crf, transition, beats, cache: See segmented_writer.
+
+    Returns:
+        list: The tasks of the segments, in the order of the video, empty if 
+              there are no images.
+    """
+
+    # Path to save the segments
+    segment_path = path.join("resources\\videos", "segments")
+
+    # If the directory doesn't exist, create it
+    if not path.exists(segment_path):
+        makedirs(segment_path)
+
+    # Same order, counters and cuts as the whole video
+    fnames = [path.join(downloading_path, file) for file in sorted_images(downloading_path)]
+    total_files = len(fnames)
+
+    if total_files == 0:
+        print(f"\n\n**** NO IMAGES IN {downloading_path} ****\n\n")
+        return []
+
+    fps = timeline_fps(total_files, duration)
+    cuts = timeline_cuts(total_files, duration, fps, beats)
+
+    stem = path.splitext(vid_name)[0]
+    tasks = []
+    for index, (start, stop) in enumerate(segment_bounds(total_files, segments or cpu_count())):
+        segment_file = path.join(segment_path, f"{stem}_{index:04d}.mp4")
+        tasks.append((fnames[start:stop + 1], start + 1, total_files,
+            [cut - cuts[start] for cut in cuts[start:stop + 1]], fps, segment_file,
+            max_h, max_w, codec, encoder, bitrate, crf, transition, cache))
+
+    print(f"\n==== {total_files} image(s) in {len(tasks)} segment(s) ====\n")
+
+    return tasks
+
+
+def join_segments(segment_files: List[str], duration: int, vid_name: str="video.mp4",
+    encoder: str="opencv", audio_path: Union[str, List[str], None]=None) -> str:
+
+    """
+    Joins the rendered segments into the video, and removes them.
+
+    Args:
+        segment_files (list): The paths to the segments, in order.
+        duration (int): Duration of the video in seconds.
+        vid_name, encoder, audio_path: See VideoWriter.create_video_writer.
+
+    Returns:
+        str: Path where the video is saved.
+    """
+
+    video_file = path.join("resources\\videos", vid_name)
+    segment_path = path.dirname(segment_files[0])
+    stem = path.splitext(vid_name)[0]
+
+    try:
+        if encoder == "ffmpeg" and audio_path is not None:
+            # Join, then put the audio on without touching the video
+            joined_file = path.join(segment_path, f"{stem}_joined.mp4")
+            concat_segments(segment_files, joined_file)
+            subprocess.run(mux_command(joined_file, audio_path, duration, video_file),
+                check=True)
+            remove(joined_file)
+        else:
+            concat_segments(segment_files, video_file)
+
+    except subprocess.CalledProcessError as error:
+        print(f"\n\n**** AN ERROR OCCURRED WHILE JOINING THE SEGMENTS: {error} ****\n\n")
+        raise
+
+    for segment_file in segment_files:
+        remove(segment_file)
+
+    print(f"\n==== Video saved at: {video_file} ====\n")
+
+    return video_file
+
+
+def segmented_writer(downloading_path: str, duration: int, segments: int = 0,
+    vid_name: str="video.mp4", max_h: int=1080, max_w: int=1920,
+    codec: str='mp4v', encoder: str="opencv",
+    audio_path: Union[str, List[str], None]=None, bitrate: str="15000k",
+    crf: Optional[int]=None, transition: str="cut",
+    beats: Optional[List[float]]=None, cache: Optional[FrameCache]=None
+    ) -> Optional[str]:
+
+    """
+    Alters the downloaded images and writes the video in segments, each in its
+    own process, and joins them.
+
+    Args:
+        downloading_path (str): The path to the directory containing the images.
+        duration (int): Duration of the video in seconds.
+        segments (int, optional): Number of segments (and processes). Defaults
+                                  to 0 (one per core).
+        vid_name, max_h, max_w, codec, encoder, audio_path, bitrate, crf,
+        transition, beats: See VideoWriter.create_video_writer.
+        cache (FrameCache, optional): Cache of altered images. Defaults to None.
+
+    Returns:
+        str: Path where the video is saved, None if there are no images.
+    """
+
+    print("\n==== Writing the video in segments ====\n")
+
+    tasks = segment_tasks(downloading_path, duration, segments, vid_name, max_h,
+        max_w, codec, encoder, bitrate, crf, transition, beats, cache)
+
+    # Nothing to write, like video_writer
+    if not tasks:
+        return None
+
+    with ProcessPoolExecutor(max_workers=len(tasks)) as executor:
+        segment_files = []
+        for segment_file, timings in executor.map(render_segment, tasks):
+            decode_timings.merge(timings)
+            segment_files.append(segment_file)
+
+    # Keep the cache within its size cap
+    if cache is not None:
+        cache.evict()
+
+    decode_timings.report()
+
+    return join_segments(segment_files, duration, vid_name, encoder, audio_path)
@@ -0,0 +1,256 @@
+"""
+Timeline of the slideshow, at a fixed output frame rate.
+
+The video used to be written at `total_files // duration` fps, one frame per
+image, so 59 images in 30 s came out at 1 fps and lasted 59 s, while the audio
+was cut at 30 s. Frame rates can't be fractions of the number of images, but
+the number of frames each image is shown for can be anything.
+
+The video is written at OUTPUT_FPS and lasts `duration * fps` frames, the
+frames are spread as evenly as possible over the images:
+
+    image i is shown for floor((i + 1) * F / N) - floor(i * F / N) frames
+
+which adds up to exactly F frames. An image is decoded and altered once and
+written as many times as it's shown, by reference. Only with more images than
+frames (N > F) does the frame rate go up instead, to N / duration, one frame
+per image.
+
+An image is written once the next one arrives, so the Transitions between the
+two can be rendered on the way.
+
+With --beat_sync the cuts between the images are moved onto the beats of the
+audio (see BeatSync.py and beat_cuts), still adding up to F frames.
+"""
+
+import numpy as np
+from bisect import bisect_left
+from typing import Optional, Any, List
+from Transitions import Transitions
+
+# Frame rate of the videos
+OUTPUT_FPS = 30
+
+
+def timeline_fps(total_images: int, duration: float, fps: int = OUTPUT_FPS) -> float:
+
+    """
+    Returns the frame rate of a video.
+
+    Args:
+        total_images (int): Number of images in the video.
+        duration (float): Duration (in seconds) of the video.
+        fps (int, optional): Output frame rate. Defaults to OUTPUT_FPS.
+
+    Returns:
+        float: fps, or total_images / duration if there are more images than
+               frames at fps.
+    """
+
+    if total_images <= round(duration * fps):
+        return fps
+
+    return total_images / duration
+
+
+def beat_cuts(beats: List[float], total_images: int, duration: float,
+    fps: float) -> List[int]:
+
+    """
+    Moves the cuts between the images onto the beats of the audio.
+
+    Every cut goes to the beat nearest to where it would be, if there's one
+    within half the share of an image, and stays where it is otherwise. Every
+    image keeps at least one frame.
+
+    Args:
+        beats (list): The times (in seconds) of the beats.
+        total_images (int): Number of images in the video.
+        duration (float): Duration (in seconds) of the video.
+        fps (float): Frame rate of the video, as returned by timeline_fps.
+
+    Returns:
+        list: The frame each image starts at, followed by the number of frames
+              of the video (total_images + 1 entries), [0] without images.
+    """
+
+    # Nothing to cut
+    if total_images == 0:
+        return [0]
+
+    total_frames = max(round(duration * fps), total_images)
+    beat_frames = sorted({round(time * fps) for time in beats})
+    reach = total_frames / total_images / 2
+
+    cuts = [0]
+    for index in range(1, total_images):
+        even = index * total_frames // total_images
+
+        # Nearest beat on either side of the even cut
+        position = bisect_left(beat_frames, even)
+        nearest = min(beat_frames[max(position - 1, 0):position + 1],
+            key=lambda frame: abs(frame - even), default=even)
+        cut = nearest if abs(nearest - even) <= reach else even
+
+        # At least a frame for this image and every one after it
+        cuts.append(min(max(cut, cuts[-1] + 1), total_frames - (total_images - index)))
+
+    cuts.append(total_frames)
+    return cuts
+
+
+def timeline_cuts(total_images: int, duration: float, fps: float,
+    beats: Optional[List[float]] = None) -> List[int]:
+
+    """
+    Returns the frame every image starts at.
+
+    Args:
+        total_images (int): Number of images in the video.
+        duration (float): Duration (in seconds) of the video.
+        fps (float): Frame rate of the video, as returned by timeline_fps.
+        beats (list, optional): Times (in seconds) of the beats the cuts are
+                                moved onto. Defaults to None (even shares).
+
+    Returns:
+        list: The frame each image starts at, followed by the number of frames
+              of the video (total_images + 1 entries), [0] without images.
+    """
+
+    if beats:
+        return beat_cuts(beats, total_images, duration, fps)
+
+    # Nothing to cut
+    if total_images == 0:
+        return [0]
+
+    total_frames = max(round(duration * fps), total_images)
+    return [index * total_frames // total_images for index in range(total_images + 1)]
+
+
+class Timeline:
+
+    """
+    Writes every image for its share of the frames of the video.
+
+    Writes and releases like cv2.VideoWriter, one write per image, so it can
+    wrap the writer returned by create_video_writer.
+
+    Attributes:
+    - writer (cv2.VideoWriter or FFmpegEncoder): The underlying writer.
+    - total_images (int): Number of images in the video.
+    - total_frames (int): Number of frames in the video.
+    - index (int): Number of images handed over so far.
+    - transitions (Transitions): Renders the transitions between the images.
+    - pending (np.ndarray): The image on screen, written once the next one
+                            arrives (it may fade into it).
+    - pending_frames (int): Number of frames the pending image is shown for.
+    - cuts (list): The frame every image starts at (see beat_cuts), None for 
+                   evenly spread images.
+
+    Note:
+        The images handed over must not be changed afterwards, the last one is
+        kept until the next arrives.
+    """
+
+    def __init__(self, writer: Any, total_images: int, duration: float,
+        fps: float, transitions: Optional[Transitions] = None, 
+        cuts: Optional[List[int]] = None) -> None:
+
+        """
+        Initializes Timeline.
+
+        Args:
+        - writer (cv2.VideoWriter or FFmpegEncoder): The writer, opened at fps.
+        - total_images (int): Number of images in the video.
+        - duration (float): Duration (in seconds) of the video.
+        - fps (float): Frame rate of the writer, as returned by timeline_fps.
+        - transitions (Transitions, optional): Transitions between the images.
+                                               Defaults to None (hard cuts).
+        - cuts (list, optional): The frame every image starts at, as returned 
+                                 by beat_cuts. Defaults to None (even shares).
+        """
+
+        self.writer = writer
+        self.total_images = total_images
+        self.total_frames = cuts[-1] if cuts else max(round(duration * fps), total_images)
+        self.index = 0
+        self.transitions = transitions if transitions is not None else Transitions()
+        self.pending = None
+        self.pending_frames = 0
+        self.cuts = cuts
+
+    def repeats(self, index: int) -> int:
+
+        """
+        Returns the number of frames an image is shown for.
+
+        Args:
+        - index (int): Position of the image in the video, from 0.
+
+        Returns:
+        - int: Number of frames.
+        """
+
+        if self.cuts is not None:
+            return self.cuts[index + 1] - self.cuts[index]
+
+        return ((index + 1) * self.total_frames // self.total_images -
+            index * self.total_frames // self.total_images)
+
+    def write(self, frame: np.ndarray) -> None:
+
+        """
+        Hands the next image over, writing the previous one for its share of
+        the frames (fading into this one if asked for).
+
+        Args:
+        - frame (np.ndarray): The altered image.
+
+        Returns:
+        - None
+        """
+
+        if self.pending is not None:
+            self.transitions.shot(self.writer, self.pending, self.pending_frames, frame)
+            self.pending_frames = 0
+
+        self.pending = frame
+        self.pending_frames += self.repeats(self.index)
+        self.index += 1
+
+    def hold(self) -> None:
+
+        """
+        Keeps the previous image on screen over the share of an image without
+        a frame, so the video still lasts its duration. With no previous image
+        the next one is shown for the share instead.
+
+        Returns:
+        - None
+        """
+
+        self.pending_frames += self.repeats(self.index)
+        self.index += 1
+
+    def release(self, next_frame: Optional[np.ndarray] = None) -> None:
+
+        """
+        Writes the last image and releases the underlying writer.
+
+        Args:
+        - next_frame (np.ndarray, optional): The image after the last one, when
+                                             the video is a segment of a longer
+                                             one, for the last image to fade
+                                             into. Defaults to None.
+
+        Returns:
+        - None
+        """
+
+        if self.pending is not None:
+            self.transitions.shot(self.writer, self.pending, self.pending_frames, 
+                next_frame)
+            self.pending = None
+
+        self.writer.release()
@@ -0,0 +1,147 @@
+"""
+Transitions between the images of the slideshow.
+
+The slideshow hard-cuts from one image to the next. Two transitions can be
+turned on, alone or together (--transition):
+
+    crossfade   the last half second of an image fades into the next one
+    kenburns    every image slowly zooms in while it's on screen
+
+Both are computed on the fly by the Timeline, from the image on screen and the
+next one, into buffers allocated once: a zoomed frame is a single warpAffine
+into a buffer, a crossfade frame a single addWeighted into another. With hard
+cuts every image is written as is, by reference.
+"""
+
+import cv2
+import numpy as np
+from typing import Optional
+
+# Transitions which can be asked for
+TRANSITIONS = ("cut", "crossfade", "kenburns", "both")
+
+
+class Transitions:
+
+    """
+    Renders the frames of the transitions into reused buffers.
+
+    Attributes:
+    - fade_frames (int): Number of frames a crossfade lasts, 0 for hard cuts.
+    - zoom (float): How much an image zooms in while on screen, 0 for none
+                    (0.08 zooms from 100% to 108%).
+    - buffers (dict): Frame buffers, by use, allocated on first use.
+    """
+
+    def __init__(self, transition: str = "cut", fps: float = 30,
+        fade_seconds: float = 0.5, zoom: float = 0.08) -> None:
+
+        """
+        Initializes Transitions.
+
+        Args:
+        - transition (str, optional): One of TRANSITIONS. Defaults to "cut".
+        - fps (float, optional): Frame rate of the video. Defaults to 30.
+        - fade_seconds (float, optional): Length of a crossfade. Defaults to 0.5.
+        - zoom (float, optional): Zoom of the Ken Burns effect. Defaults to 0.08.
+        """
+
+        self.fade_frames = round(fade_seconds * fps) if transition in ("crossfade", "both") else 0
+        self.zoom = zoom if transition in ("kenburns", "both") else 0.0
+        self.buffers = {}
+
+    def buffer(self, name: str, like: np.ndarray) -> np.ndarray:
+
+        """
+        Returns a frame buffer, allocated the first time it's asked for.
+
+        Args:
+        - name (str): What the buffer is used for.
+        - like (np.ndarray): A frame of the video, for the shape of the buffer.
+
+        Returns:
+        - np.ndarray: The buffer.
+        """
+
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != like.shape:
+            buffer = self.buffers[name] = np.empty_like(like)
+
+        return buffer
+
+    def zoomed(self, frame: np.ndarray, progress: float, name: str) -> np.ndarray:
+
+        """
+        Zooms into the centre of a frame, as far as the image has been on screen.
+
+        Args:
+        - frame (np.ndarray): The image.
+        - progress (float): How far the image has been on screen, 0 to 1.
+        - name (str): The buffer the zoomed frame is written to.
+
+        Returns:
+        - np.ndarray: The zoomed frame, the image itself if there's no zoom.
+        """
+
+        scale = 1 + self.zoom * progress
+        if scale == 1:
+            return frame
+
+        # Scale around the centre of the frame
+        height, width = frame.shape[:2]
+        matrix = np.float32([[scale, 0, (1 - scale) * width / 2],
+            [0, scale, (1 - scale) * height / 2]])
+
+        dst = self.buffer(name, frame)
+        cv2.warpAffine(frame, matrix, (width, height), dst=dst, flags=cv2.INTER_LINEAR)
+
+        return dst
+
+    def crossfaded(self, outgoing: np.ndarray, incoming: np.ndarray,
+        alpha: float) -> np.ndarray:
+
+        """
+        Blends the image going off screen with the one coming on.
+
+        Args:
+        - outgoing (np.ndarray): Frame of the image going off screen.
+        - incoming (np.ndarray): Frame of the image coming on screen.
+        - alpha (float): How far the crossfade is, 0 to 1.
+
+        Returns:
+        - np.ndarray: The blended frame.
+        """
+
+        dst = self.buffer("fade", outgoing)
+        cv2.addWeighted(outgoing, 1 - alpha, incoming, alpha, 0, dst=dst)
+
+        return dst
+
+    def shot(self, writer, frame: np.ndarray, frames: int,
+        next_frame: Optional[np.ndarray] = None) -> None:
+
+        """
+        Writes an image for all of its frames, fading into the next image over
+        the last ones.
+
+        Args:
+        - writer (cv2.VideoWriter or FFmpegEncoder): The writer.
+        - frame (np.ndarray): The image.
+        - frames (int): Number of frames the image is shown for.
+        - next_frame (np.ndarray, optional): The next image, None for the last.
+
+        Returns:
+        - None
+        """
+
+        # Frames given to the crossfade, at most half of the image's
+        fade = min(self.fade_frames, frames // 2) if next_frame is not None else 0
+
+        for k in range(frames):
+            out = self.zoomed(frame, k / frames, "zoom")
+
+            # The next image comes on unzoomed, where its own shot starts
+            if k >= frames - fade:
+                out = self.crossfaded(out, next_frame, (k - frames + fade + 1) / (fade + 1))
+
+            writer.write(out)
@@ -1,21 +1,256 @@
 import cv2
 import subprocess
+import numpy as np
 from os import path, mkdir, listdir
+from typing import Tuple, Iterable, Optional, List, Union
+from OrderIndex import load_order
+from Timeline import Timeline, timeline_fps, beat_cuts
+from Transitions import Transitions
+from Playlist import playlist_args
+
+
+class FFmpegEncoder:
+
+    """
+    Encodes the slideshow in a single pass by piping raw BGR frames into one 
+    ffmpeg process, which also muxes the audio, pads/scales the video like 
+    video_enhancer and sets the bitrate (or CRF).
+
+    The regular path encodes the video twice (mp4v by cv2.VideoWriter, 
+    libx264 by video_enhancer), losing quality every time. 
+    Writes and releases like cv2.VideoWriter, so it can stand in for it.
+
+    Attributes:
+    - video_path (str): Path where the video is saved.
+    - command (list): The ffmpeg command line.
+    - process (subprocess.Popen): The running ffmpeg process.
+    """
+
+    def __init__(self, video_path: str, fps: float, frame_size: Tuple[int, int], 
+        audio_path: Union[str, List[str], None] = None, 
+        duration: Optional[float] = None, 
+        bitrate: Optional[str] = "15000k", crf: Optional[int] = None, 
+        aspect_ratio: int = 1920, codec: str = "libx264", 
+        preset: str = "medium") -> None:
+
+        """
+        Initializes FFmpegEncoder and starts ffmpeg.
+
+        Args:
+        - video_path (str): Path where the video is saved.
+        - fps (float): Frames per second of the video.
+        - frame_size (tuple): Width and height of the frames.
+        - audio_path (str or list, optional): Audio muxed into the video, or 
+                                              the tracks of a playlist (see 
+                                              Playlist.py). Defaults to None 
+                                              (no audio).
+        - duration (float, optional): Cuts the video (and audio) at this many 
+                                      seconds. Defaults to None.
+        - bitrate (str, optional): Target video bitrate. Defaults to "15000k".
+        - crf (int, optional): Constant rate factor, used instead of the bitrate.
+                               Defaults to None.
+        - aspect_ratio (int, optional): Same as video_enhancer. Defaults to 1920.
+        - codec (str, optional): ffmpeg video encoder. Defaults to "libx264".
+        - preset (str, optional): Encoder preset. Defaults to "medium".
+        """
+
+        self.video_path = video_path
+        width, height = frame_size
+
+        self.command = [
+            "ffmpeg", "-y", "-nostats", "-loglevel", "error",
+            # raw frames from stdin
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+            "-r", str(fps), "-i", "-",
+        ]
+
+        # audio track (or playlist), re-encoded once
+        if isinstance(audio_path, str):
+            self.command += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+        elif audio_path is not None:
+            self.command += playlist_args(audio_path, 1, duration)
+            self.command += ["-map", "0:v", "-map", "[playlist]"]
+
+        if audio_path is not None:
+            self.command += ["-c:a", "aac", "-b:a", "192k"]
+
+        self.command += [
+            # same padding and scaling as video_enhancer
+            "-vf", enhance_filter(aspect_ratio),
+            "-c:v", codec, "-preset", preset, "-pix_fmt", "yuv420p",
+        ]
+
+        # quality
+        self.command += ["-crf", str(crf)] if crf is not None else ["-b:v", bitrate]
+
+        if duration is not None:
+            self.command += ["-t", str(duration)]
+
+        self.command += [video_path]
+
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE)
+
+    def write(self, frame: np.ndarray) -> None:
+
+        """
+        Writes a frame to the video.
+
+        Args:
+        - frame (np.ndarray): A (height, width, 3) BGR uint8 frame.
+
+        Returns:
+        - None
+        """
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self) -> None:
+
+        """
+        Finishes the video, waiting for ffmpeg to flush it.
+
+        Returns:
+        - None
+
+        Raises:
+        - subprocess.CalledProcessError: If ffmpeg failed.
+        """
+
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise subprocess.CalledProcessError(self.process.returncode, self.command)
+
+
+def enhance_filter(aspect_ratio: int = 1920) -> str:
+    
+    """
+    Builds the ffmpeg filter which scales the video down to fit a square of 
+    aspect_ratio pixels and pads it to that square.
+
+    Args:
+        aspect_ratio (int, optional): Side of the square. Defaults to 1920.
+
+    Returns:
+        str: The ffmpeg video filter.
+    """
+
+    # change aspect ratio
+    return (f"scale=w={aspect_ratio}:h={aspect_ratio}:force_original_aspect_ratio=decrease,"
+            # padding
+            f"pad={aspect_ratio}:{aspect_ratio}:(ow-iw)/2:(oh-ih)/2")
+
+
+def open_writer(video_file: str, fps: float, max_h: int=1080, max_w: int=1920, 
+    codec: str='mp4v', encoder: str="opencv", 
+    audio_path: Union[str, List[str], None]=None, duration: Optional[float]=None, 
+    bitrate: str="15000k", crf: Optional[int]=None):
+
+    """
+    Opens the writer frames are encoded with, cv2.VideoWriter or FFmpegEncoder.
+
+    Args:
+        video_file (str): Path where the video is saved.
+        fps (float): Frames per second of the video.
+        max_h, max_w, codec, encoder, audio_path, bitrate, crf: See 
+        create_video_writer.
+        duration (float, optional): Cuts the video at this many seconds (ffmpeg 
+                                    only). Defaults to None.
+
+    Returns:
+        cv2.VideoWriter or FFmpegEncoder: The writer.
+    """
+
+    if encoder == "ffmpeg":
+        # Single pass ffmpeg encoder
+        return FFmpegEncoder(video_file, fps, (max_w, max_h), audio_path, duration, 
+            bitrate, crf)
+
+    # Choose the codec for video writing
+    fourcc = cv2.VideoWriter_fourcc(*codec)
+
+    # Create a VideoWriter object
+    return cv2.VideoWriter(video_file, fourcc=fourcc, fps=fps, frameSize=(max_w, max_h))
+
+
+def create_video_writer(total_files: int, duration: int, 
+    vid_name: str="video.mp4", max_h: int=1080, max_w: int=1920, 
+    codec: str='mp4v', encoder: str="opencv", 
+    audio_path: Union[str, List[str], None]=None, 
+    bitrate: str="15000k", crf: Optional[int]=None, transition: str="cut", 
+    beats: Optional[List[float]]=None) -> Tuple[Timeline, str]:
+    
+    """
+    Creates the VideoWriter used to write the slideshow, wrapped in the 
+    Timeline which shows every image for its share of the duration.
+
+    Args:
+        total_files (int): Number of images which will be written to the video.
+        duration (int): Duration (in seconds) of the video. 
+        vid_name (str): Name of the output video file. Defaults to "video.mp4".
+        max_h (int, optional): Maximum height of the images. Defaults to 1080.
+        max_w (int, optional): Maximum width of the images. Defaults to 1920.
+        codec (str, optional): Codec for video compression. Defaults to 'mp4v'.
+        encoder (str, optional): "opencv" for cv2.VideoWriter, "ffmpeg" for 
+                                 FFmpegEncoder. Defaults to "opencv".
+        audio_path (str or list, optional): Audio muxed into the video, or the 
+                                            tracks of a playlist (ffmpeg only). 
+                                            Defaults to None.
+        bitrate (str, optional): Video bitrate (ffmpeg only). Defaults to "15000k".
+        crf (int, optional): Constant rate factor, used instead of the bitrate 
+                             (ffmpeg only). Defaults to None.
+        transition (str, optional): Transition between the images, one of 
+                                    Transitions.TRANSITIONS. Defaults to "cut".
+        beats (list, optional): Times (in seconds) of the beats of the audio the 
+                                cuts are moved onto (see BeatSync.detect_beats). 
+                                Defaults to None (evenly spread cuts).
+
+    Returns:
+        tuple: The Timeline (wrapping the VideoWriter object) and the path where 
+               the video is saved.
+
+    Note:
+        The ffmpeg encoder writes the finished video (audio, padding, bitrate), 
+        so there's no need for audiofy and video_enhancer after it.
+    """
+
+    # Path to save video
+    video_path = "resources\\videos"
+
+    # If the directory doesn't exist, create it
+    if not path.exists(video_path):
+        mkdir(video_path)
+
+    # Fixed output fps, unless there are more images than frames
+    fps = timeline_fps(total_files, duration)
+
+    writer = open_writer(path.join(video_path, vid_name), fps, max_h, max_w, codec, 
+        encoder, audio_path, duration, bitrate, crf)
+
+    # Every image is shown for its share of the duration
+    cuts = beat_cuts(beats, total_files, duration, fps) if beats else None
+    timeline = Timeline(writer, total_files, duration, fps, 
+        Transitions(transition, fps), cuts)
+    return timeline, path.join(video_path, vid_name)
+
 
 def video_writer(download_folder_name: str, duration: int, 
     vid_name: str="video.mp4", max_h: int=1080, max_w: int=1920, 
-    codec: str='mp4v') -> str:
+    codec: str='mp4v', encoder: str="opencv", 
+    audio_path: Union[str, List[str], None]=None, 
+    bitrate: str="15000k", crf: Optional[int]=None, transition: str="cut", 
+    beats: Optional[List[float]]=None) -> str:
     
     """
     Writes a video file from downloaded images in a specific folder using OpenCV.
 
     Args:
         download_folder_name (str): Name of the folder where image files are located.
-        duration (int): Duration (in seconds) of the video, used to calculate fps. 
+        duration (int): Duration (in seconds) of the video. 
         vid_name (str): Name of the output video file. Defaults to "video.mp4".
         max_h (int, optional): Maximum height of the images. Defaults to 1080.
         max_w (int, optional): Maximum width of the images. Defaults to 1920.
         codec (str, optional): Codec for video compression. Defaults to 'mp4v'.
+        encoder, audio_path, bitrate, crf, transition, beats: See 
+        create_video_writer.
         
     Returns:
         str: Path where the video is saved.
@@ -25,30 +260,21 @@ def video_writer(download_folder_name: str, duration: int,
         dimensions that codecs support.
     """
     print("\n==== Writing images to the video ====\n")
-    # Path to save video
-    video_path = "resources\\videos"
     
     try:
-        # If the directory doesn't exist, create it
-        if not path.exists(video_path):
-            mkdir(video_path)
-
-        # Choose the codec for video writing
-        fourcc = cv2.VideoWriter_fourcc(*codec)
-        
-        # Sorting the filenames based on their filename (number)
-        sorted_files = sorted(listdir(download_folder_name), 
-            key=lambda x: int(x.split('.')[0]))
+        # The order saved by image_modifier, otherwise sorting the filenames 
+        # based on their filename (number)
+        if (sorted_files := load_order(download_folder_name)) is None:
+            sorted_files = sorted(listdir(download_folder_name), 
+                key=lambda x: int(x.split('.')[0]))
 
         # Total files
         total_files = len(sorted_files)
-        
-        # Calculate fps from duration
-        fps = 1 if total_files <= duration else total_files // duration
 
         # Create a VideoWriter object
-        video_writer = cv2.VideoWriter(path.join(video_path, vid_name), 
-            fourcc=fourcc, fps=fps, frameSize=(max_w, max_h))
+        video_writer, video_path = create_video_writer(total_files, duration, 
+            vid_name, max_h, max_w, codec, encoder, audio_path, bitrate, crf, 
+            transition, beats)
         
         for filename in sorted_files:
             try:
@@ -65,6 +291,7 @@ def video_writer(download_folder_name: str, duration: int,
                 # Check if the image was loaded successfully
                 if final_img is None:
                     print(f"\n\n**** WARNING: FAILED TO LOAD IMAGE FILE {filename}. Skipping. ****\n\n")
+                    video_writer.hold()
                     continue
 
                 # Writing the frame
@@ -81,13 +308,69 @@ def video_writer(download_folder_name: str, duration: int,
 
         print("\n==== DONE writing images to the video ====\n")
         # Return the path where the video is saved
-        return path.join(video_path, vid_name)
+        return video_path
     
     except Exception as error:
         print(f"\n\n**** ERROR IN video_writer: {error} ****\n\n")
         return None
 
 
+def frames_writer(frames: Iterable[Optional[np.ndarray]], total_files: int, 
+    duration: int, vid_name: str="video.mp4", max_h: int=1080, max_w: int=1920, 
+    codec: str='mp4v', encoder: str="opencv", 
+    audio_path: Union[str, List[str], None]=None, 
+    bitrate: str="15000k", crf: Optional[int]=None, transition: str="cut", 
+    beats: Optional[List[float]]=None) -> str:
+    
+    """
+    Writes a video file from altered images handed over in memory.
+
+    Args:
+        frames (iterable): The altered images in the order of the video, None 
+                           for the images which couldn't be altered.
+        total_files (int): Number of images, used to calculate fps.
+        duration (int): Duration (in seconds) of the video. 
+        vid_name (str): Name of the output video file. Defaults to "video.mp4".
+        max_h (int, optional): Maximum height of the images. Defaults to 1080.
+        max_w (int, optional): Maximum width of the images. Defaults to 1920.
+        codec (str, optional): Codec for video compression. Defaults to 'mp4v'.
+        encoder, audio_path, bitrate, crf, transition, beats: See 
+        create_video_writer.
+        
+    Returns:
+        str: Path where the video is saved.
+    """
+    print("\n==== Writing images to the video ====\n")
+    
+    try:
+        # Create a VideoWriter object
+        video_writer, video_path = create_video_writer(total_files, duration, 
+            vid_name, max_h, max_w, codec, encoder, audio_path, bitrate, crf, 
+            transition, beats)
+
+        for counter, final_img in enumerate(frames, 1):
+            # Check if the image was altered successfully
+            if final_img is None:
+                print(f"\n\n**** WARNING: NO FRAME FOR IMAGE {counter}. Skipping. ****\n\n")
+                video_writer.hold()
+                continue
+
+            # Writing the frame
+            print(f"Writing image {counter}/{total_files} to the video.")
+            video_writer.write(final_img)
+
+        # Release the VideoWriter object
+        video_writer.release()
+
+        print("\n==== DONE writing images to the video ====\n")
+        # Return the path where the video is saved
+        return video_path
+    
+    except Exception as error:
+        print(f"\n\n**** ERROR IN frames_writer: {error} ****\n\n")
+        return None
+
+
 def video_enhancer(result_path: str, bitrate: str ="15000k", 
     aspect_ratio: int=1920) -> str:
     
@@ -115,10 +398,8 @@ def video_enhancer(result_path: str, bitrate: str ="15000k",
         # use ffmpeg
         "ffmpeg", "-i", result_path,
         
-        # change aspect ratio
-        "-vf", f"scale=w={aspect_ratio}:h={aspect_ratio}:force_original_aspect_ratio=decrease,"
-               # padding
-               f"pad={aspect_ratio}:{aspect_ratio}:(ow-iw)/2:(oh-ih)/2",
+        # change aspect ratio, padding
+        "-vf", enhance_filter(aspect_ratio),
         # chosen bitrate
         "-b:v", bitrate,
         # output file